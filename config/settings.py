@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -19,6 +20,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -28,11 +30,26 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Горячие страницы ученика (меню, получение питания, пополнение) в async-варианте.
+# По умолчанию выключены: под WSGI их оборачивает async_to_sync, а с SQLite выигрыша нет и под ASGI.
+# Включить: DJANGO_ASYNC_VIEWS=1
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '0') == '1'
+
+# Списание продуктов по рецептам: в конце смены пачкой (consume_inventory) или сразу при выдаче.
+# Пачка дешевле: число запросов зависит от числа блюд, а не учеников
+INVENTORY_CONSUME_AT_CHECKOUT = os.environ.get('DJANGO_INVENTORY_AT_CHECKOUT', '0') == '1'
+
+# Число последних запросов на представление, по которым считается статистика SQL
+QUERY_STATS_WINDOW = 500
+# Заголовки X-Query-* отдаются только персоналу и по умолчанию только в режиме отладки
+QUERY_STATS_HEADERS = DEBUG
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга для статистики запросов
+        'BACKEND': 'core.middleware.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -52,6 +69,58 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Реплика для отчетов: DJANGO_REPLICA_DB=/path/replica.sqlite3 и периодический
+# manage.py snapshot_replica --interval 60 (копия основной базы через backup API)
+REPLICA_DATABASE = 'replica'
+REPLICA_DB = os.environ.get('DJANGO_REPLICA_DB')
+if REPLICA_DB:
+    DATABASES[REPLICA_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{REPLICA_DB}?mode=ro',
+        'OPTIONS': {'uri': True},
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# PRAGMA, выполняемые для каждого нового соединения SQLite (core.db.configure_sqlite).
+# production: WAL — читатели не ждут писателей, synchronous=NORMAL безопасен в режиме WAL.
+# default: журнал SQLite по умолчанию, для сравнения в bench_peak --sqlite-profile
+SQLITE_PROFILES = {
+    'default': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+    },
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -20000,
+        'temp_store': 'MEMORY',
+    },
+}
+SQLITE_PRAGMAS = SQLITE_PROFILES[os.environ.get('DJANGO_SQLITE_PROFILE', 'production')]
+# На реплике, открытой только для чтения, применяются лишь PRAGMA, не меняющие файл
+SQLITE_READ_ONLY_PRAGMAS = ('busy_timeout', 'mmap_size', 'cache_size', 'temp_store')
+
+# Повторы транзакций, упавших с «database is locked»
+DB_LOCK_RETRIES = 5
+DB_LOCK_RETRY_DELAY = 0.05
+
+# Для нескольких воркеров: DJANGO_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# и DJANGO_CACHE_LOCATION=/var/tmp/canteen_cache (или общий Redis/Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'canteen'),
     }
 }
 
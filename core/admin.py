@@ -1,19 +1,86 @@
+from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Alergen, Product, Dish, Menu, Attendance, Payment, Subscription, Applications, Reviews
+from django.contrib.auth.forms import UserChangeForm, AdminPasswordChangeForm
+from .models import (User, Alergen, Product, Dish, DishProduct, Menu, MenuDish, Attendance, Payment,
+                     Subscription, Applications, ApplicationItem, Reviews, DailyStats, BalanceEntry, BalanceSnapshot,
+                     Notification)
+from .routers import use_replica
+from .search import filter_queryset
+from .services import adjust_balance
+
+
+class IndexedSearchMixin:
+    # Поиск по полнотекстовому индексу вместо LIKE-сканирования search_fields
+    search_kind = None
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return filter_queryset(queryset, self.search_kind, search_term), False
+
+
+class ReplicaChangelistMixin:
+    # Просмотр списка читает с реплики; действия и list_editable (POST) идут в основную базу
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with use_replica():
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+
+class DishProductInline(admin.TabularInline):
+    model = DishProduct
+    extra = 1
+    autocomplete_fields = ('product',)
+
+
+class MenuDishInline(admin.TabularInline):
+    model = MenuDish
+    extra = 1
+    autocomplete_fields = ('dish',)
+
+
+class ApplicationItemInline(admin.TabularInline):
+    model = ApplicationItem
+    extra = 1
+    autocomplete_fields = ('product',)
+
+
+class UserBalanceChangeForm(UserChangeForm):
+    # Баланс в форме только для чтения: правка идет корректировкой через журнал операций
+    balance_adjustment = forms.IntegerField(label='Корректировка баланса', required=False,
+                                            help_text='Сумма, на которую изменить баланс (со знаком минус — списать)')
+
+
+class UserPasswordChangeForm(AdminPasswordChangeForm):
+    def save(self, commit=True):
+        self.user.set_password(self.cleaned_data['password1'])
+        if commit:
+            # Только пароль: полное сохранение записало бы баланс, прочитанный при открытии формы
+            self.user.save(update_fields=['password'])
+        return self.user
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(IndexedSearchMixin, BaseUserAdmin):
     list_display = ('login', 'name', 'email', 'role', 'balance', 'is_active')
     list_filter = ('role', 'is_active')
     search_fields = ('login', 'name', 'email')
+    search_kind = 'user'
     ordering = ('login',)
+    filter_horizontal = ('alergens',)
+    form = UserBalanceChangeForm
+    change_password_form = UserPasswordChangeForm
+    readonly_fields = ('balance',)
     
     fieldsets = (
         (None, {'fields': ('login', 'password')}),
         ('Личная информация', {'fields': ('name', 'email', 'birth_date', 'alergens')}),
-        ('Роль и баланс', {'fields': ('role', 'balance')}),
+        ('Роль и баланс', {'fields': ('role', 'balance', 'balance_adjustment')}),
         ('Права доступа', {'fields': ('is_active', 'is_staff', 'is_superuser')}),
     )
     
@@ -23,6 +90,16 @@ class UserAdmin(BaseUserAdmin):
             'fields': ('login', 'email', 'name', 'password1', 'password2', 'role'),
         }),
     )
+    
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Баланс не пишем: его меняют только условные UPDATE с записью в журнал
+        obj.save(update_fields=[f.name for f in obj._meta.concrete_fields
+                                if not f.primary_key and f.name != 'balance'])
+        adjustment = form.cleaned_data.get('balance_adjustment')
+        if adjustment:
+            adjust_balance(obj, adjustment, reference=f'admin:{request.user.login}')
 
 
 @admin.register(Alergen)
@@ -32,44 +109,67 @@ class AlergenAdmin(admin.ModelAdmin):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'amount', 'alergens')
+class ProductAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('id', 'name', 'amount', 'alergens_display')
     search_fields = ('name',)
+    search_kind = 'product'
     list_editable = ('amount',)
+    filter_horizontal = ('alergens',)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('alergens')
+    
+    @admin.display(description='Аллергены')
+    def alergens_display(self, obj):
+        return ', '.join(a.name for a in obj.alergens.all())
 
 
 @admin.register(Dish)
-class DishAdmin(admin.ModelAdmin):
+class DishAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('id', 'name', 'price', 'amount')
     search_fields = ('name',)
+    search_kind = 'dish'
     list_editable = ('price', 'amount')
+    inlines = (DishProductInline,)
 
 
 @admin.register(Menu)
 class MenuAdmin(admin.ModelAdmin):
-    list_display = ('date', 'breakfast', 'lunch', 'given_breakfasts_amount', 'given_lunches_amount')
+    list_display = ('date', 'breakfast_display', 'lunch_display', 'given_breakfasts_amount', 'given_lunches_amount')
     list_filter = ('date',)
     date_hierarchy = 'date'
+    inlines = (MenuDishInline,)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('menu_dishes__dish')
+    
+    @admin.display(description='Завтрак')
+    def breakfast_display(self, obj):
+        return ', '.join(d.name for d in obj.get_breakfast_dishes())
+    
+    @admin.display(description='Обед')
+    def lunch_display(self, obj):
+        return ', '.join(d.name for d in obj.get_lunch_dishes())
 
 
 @admin.register(Attendance)
-class AttendanceAdmin(admin.ModelAdmin):
+class AttendanceAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'date', 'meal_type')
     list_filter = ('date', 'meal_type')
     search_fields = ('user__name', 'user__login')
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'amount', 'date', 'succesful')
     list_filter = ('date', 'succesful')
     search_fields = ('user__name',)
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
-    list_display = ('user', 'meal_type', 'register_date', 'end_date', 'duration')
-    list_filter = ('meal_type', 'register_date')
+class SubscriptionAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('user', 'meal_type', 'register_date', 'end_date', 'duration', 'price', 'status', 'auto_renew')
+    list_filter = ('status', 'auto_renew', 'meal_type', 'register_date')
     search_fields = ('user__name',)
 
 
@@ -79,10 +179,52 @@ class ApplicationsAdmin(admin.ModelAdmin):
     list_filter = ('status', 'date')
     search_fields = ('user__name',)
     list_editable = ('status',)
+    list_select_related = ('user',)
+    inlines = (ApplicationItemInline,)
 
 
 @admin.register(Reviews)
-class ReviewsAdmin(admin.ModelAdmin):
+class ReviewsAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'dish', 'review', 'created_at')
     list_filter = ('review', 'created_at')
     search_fields = ('user__name', 'dish__name')
+
+
+@admin.register(DailyStats)
+class DailyStatsAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('date', 'payments_total', 'payments_count', 'breakfasts', 'lunches',
+                    'breakfast_revenue', 'lunch_revenue', 'purchases_total')
+    date_hierarchy = 'date'
+
+
+@admin.register(BalanceEntry)
+class BalanceEntryAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('id', 'user', 'kind', 'amount', 'reference', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('user__login', 'reference')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    
+    # Журнал только дополняется: правки идут новыми записями через сервисы
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BalanceSnapshot)
+class BalanceSnapshotAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('user', 'entry_id', 'balance', 'created_at')
+    search_fields = ('user__login',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(Notification)
+class NotificationAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('user', 'kind', 'reference', 'created_at', 'read_at')
+    list_filter = ('kind',)
+    search_fields = ('user__login', 'reference')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
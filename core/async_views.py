@@ -0,0 +1,85 @@
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.http import JsonResponse
+from django.shortcuts import render, redirect
+from django.utils import timezone
+
+from .decorators import async_role_required
+from .forms import PaymentForm
+from .menu_cache import get_daily_menu
+from .models import Payment
+from .services import take_meal, top_up_balance, CheckoutError
+from .student_status import get_today_status
+from .views import menu_context
+
+
+def student_day(user, today):
+    return get_daily_menu(today), get_today_status(user, today)
+
+
+async def load_student_day(user, today):
+    # Меню и статус ученика берутся из кэша; промах уходит в базу, поэтому один переход в рабочий поток
+    return await sync_to_async(student_day)(user, today)
+
+
+@async_role_required('student')
+async def student_menu(request):
+    today = timezone.now().date()
+    menu, status = await load_student_day(request.user, today)
+    return render(request, 'student/menu.html', menu_context(request.user, today, menu, status))
+
+
+@async_role_required('student')
+async def student_menu_json(request):
+    today = timezone.now().date()
+    menu, status = await load_student_day(request.user, today)
+    context = menu_context(request.user, today, menu, status)
+    subscription = status['subscription']
+    return JsonResponse({
+        'date': today.isoformat(),
+        'has_menu': menu is not None,
+        'breakfast': context['breakfast_dishes'],
+        'lunch': context['lunch_dishes'],
+        'breakfast_taken': status['breakfast_taken'],
+        'lunch_taken': status['lunch_taken'],
+        'balance': status['balance'],
+        'subscription': {
+            'meal_type': subscription.meal_type,
+            'end_date': subscription.end_date.isoformat(),
+        } if subscription else None,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@async_role_required('student')
+async def student_take_meal(request, meal_type):
+    # Списание идет одной транзакцией, а транзакции в async ORM не поддерживаются
+    try:
+        await sync_to_async(take_meal)(request.user, meal_type)
+    except CheckoutError as e:
+        messages.error(request, str(e))
+        return redirect('student_menu')
+    
+    messages.success(request, f'Питание ({meal_type}) получено!')
+    return redirect('student_menu')
+
+
+@async_role_required('student')
+async def student_payment(request):
+    if request.method == 'POST':
+        form = PaymentForm(request.POST)
+        if form.is_valid():
+            amount = form.cleaned_data['amount']
+            
+            await sync_to_async(top_up_balance)(request.user, amount)
+            
+            messages.success(request, f'Баланс пополнен на {amount} руб.')
+            return redirect('student_menu')
+    else:
+        form = PaymentForm()
+    
+    payments = [payment async for payment in Payment.objects.filter(user=request.user)[:10]]
+    
+    return render(request, 'student/payment.html', {
+        'form': form,
+        'payments': payments
+    })
@@ -0,0 +1,75 @@
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+class BenchRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.started = None
+        self.finished = None
+
+    @contextmanager
+    def measure(self, name):
+        queries = []
+
+        def counter(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            yield
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.samples.setdefault(name, []).append((elapsed, len(queries)))
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def report(self):
+        duration = (self.finished or time.perf_counter()) - self.started
+        rows = []
+        for name, samples in self.samples.items():
+            latencies = [s[0] * 1000 for s in samples]
+            rows.append({
+                'view': name,
+                'count': len(samples),
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'queries': statistics.mean(s[1] for s in samples),
+                'rps': len(samples) / duration if duration else 0,
+            })
+        return duration, rows
+
+    def format_report(self):
+        duration, rows = self.report()
+        total = sum(r['count'] for r in rows)
+        lines = [
+            f"{'view':<24}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'req/s':>9}",
+        ]
+        for r in rows:
+            lines.append(
+                f"{r['view']:<24}{r['count']:>7}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}"
+                f"{r['queries']:>9.1f}{r['rps']:>9.1f}"
+            )
+        lines.append(f'Всего запросов: {total} за {duration:.1f} с ({total / duration if duration else 0:.1f} req/s)')
+        return '\n'.join(lines)
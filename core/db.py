@@ -0,0 +1,43 @@
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection, OperationalError
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+LOCK_ERRORS = ('database is locked', 'database table is locked', 'database is busy')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if connection.alias == getattr(settings, 'REPLICA_DATABASE', None):
+        pragmas = {k: v for k, v in pragmas.items() if k in settings.SQLITE_READ_ONLY_PRAGMAS}
+    # Выполняем напрямую через драйвер, чтобы PRAGMA не попадали в статистику запросов
+    for name, value in pragmas.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return any(text in message for text in LOCK_ERRORS)
+
+
+def retry_on_locked(func):
+    # Повтор имеет смысл только для целой транзакции: внутри внешнего atomic ошибку пробрасываем
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        attempts = getattr(settings, 'DB_LOCK_RETRIES', 5)
+        delay = getattr(settings, 'DB_LOCK_RETRY_DELAY', 0.05)
+        for attempt in range(attempts):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_lock_error(e) or connection.in_atomic_block or attempt == attempts - 1:
+                    raise
+                time.sleep(delay * 2 ** attempt * (1 + random.random()))
+    return wrapper
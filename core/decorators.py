@@ -1,6 +1,10 @@
 from functools import wraps
+from asgiref.sync import sync_to_async
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+
+from .routers import read_only, use_replica
 
 
 def role_required(*roles):
@@ -17,6 +21,22 @@ def role_required(*roles):
     return decorator
 
 
+def async_role_required(*roles):
+    # login_required и role_required для async-представлений: пользователь и сессия
+    # загружаются из базы в потоке, дальше request.user читается без запросов
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if not await sync_to_async(lambda: request.user.is_authenticated)():
+                return redirect_to_login(request.get_full_path())
+            if request.user.role not in roles:
+                messages.error(request, 'У вас нет доступа к этой странице')
+                return redirect('dashboard')
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 def student_required(view_func):
     return role_required('student')(view_func)
 
@@ -27,3 +47,33 @@ def cook_required(view_func):
 
 def admin_required(view_func):
     return role_required('admin')(view_func)
+
+
+def read_only_view(view_func):
+    # Отчеты и списки читают с реплики; потоковый ответ тоже дочитывается с нее
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with use_replica():
+            response = view_func(request, *args, **kwargs)
+        if getattr(response, 'streaming', False):
+            stream = areplica_stream if response.is_async else replica_stream
+            response.streaming_content = stream(response.streaming_content)
+        return response
+    return wrapper
+
+
+def replica_stream(content):
+    token = read_only.set(True)
+    try:
+        yield from content
+    finally:
+        read_only.reset(token)
+
+
+async def areplica_stream(content):
+    token = read_only.set(True)
+    try:
+        async for part in content:
+            yield part
+    finally:
+        read_only.reset(token)
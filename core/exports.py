@@ -0,0 +1,73 @@
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from .models import Payment, Attendance, Subscription, ApplicationItem
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORTS = {
+    'payments': {
+        'title': 'Платежи',
+        'header': ['ID', 'Дата', 'Логин', 'ФИО', 'Сумма', 'Успешно'],
+        'queryset': lambda start, end: Payment.objects.filter(date__gte=start, date__lte=end).order_by('date', 'id')
+        .values_list('id', 'date', 'user__login', 'user__name', 'amount', 'succesful'),
+    },
+    'attendance': {
+        'title': 'Посещения',
+        'header': ['ID', 'Дата', 'Логин', 'ФИО', 'Прием пищи', 'Списано'],
+        'queryset': lambda start, end: Attendance.objects.filter(date__gte=start, date__lte=end).order_by('date', 'id')
+        .values_list('id', 'date', 'user__login', 'user__name', 'meal_type', 'price'),
+    },
+    'subscriptions': {
+        'title': 'Абонементы',
+        'header': ['ID', 'Дата оформления', 'Дата окончания', 'Логин', 'ФИО', 'Тип питания', 'Дней'],
+        'queryset': lambda start, end: Subscription.objects.filter(register_date__gte=start, register_date__lte=end)
+        .order_by('register_date', 'id')
+        .values_list('id', 'register_date', 'end_date', 'user__login', 'user__name', 'meal_type', 'duration'),
+    },
+    'applications': {
+        'title': 'Закупки',
+        'header': ['Заявка', 'Дата', 'Создал', 'Продукт', 'Количество', 'Стоимость заявки'],
+        'queryset': lambda start, end: ApplicationItem.objects.filter(
+            application__date__gte=start, application__date__lte=end, application__status='approved'
+        ).order_by('application__date', 'application_id', 'id')
+        .values_list('application_id', 'application__date', 'application__user__name', 'product__name', 'amount',
+                     'application__price'),
+    },
+}
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def stream_export(kind, start_date, end_date):
+    export = EXPORTS[kind]
+    writer = csv.writer(Echo())
+    # BOM, чтобы Excel правильно открыл кириллицу
+    yield '\ufeff'
+    yield writer.writerow(export['header'])
+    for row in export['queryset'](start_date, end_date).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield writer.writerow(row)
+
+
+async def astream_export(kind, start_date, end_date):
+    # Под ASGI Django 4.2 дочитывает синхронный итератор целиком через sync_to_async(list),
+    # поэтому там отдаем асинхронный: строки читаются пачками по EXPORT_CHUNK_SIZE
+    export = EXPORTS[kind]
+    writer = csv.writer(Echo())
+    yield '\ufeff'
+    yield writer.writerow(export['header'])
+    # aiterator() в 4.2 выполняет запрос values_list прямо в async-контексте, поэтому пачки берем сами
+    rows = await sync_to_async(lambda: iter(
+        export['queryset'](start_date, end_date).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    ))()
+    while True:
+        chunk = await sync_to_async(lambda: list(islice(rows, EXPORT_CHUNK_SIZE)))()
+        if not chunk:
+            break
+        for row in chunk:
+            yield writer.writerow(row)
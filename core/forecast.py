@@ -0,0 +1,146 @@
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .models import DailyStats, Subscription, Product, DishProduct, Applications, ApplicationItem
+
+MEAL_TYPES = ('breakfast', 'lunch')
+MEAL_INDEX = {meal_type: i for i, meal_type in enumerate(MEAL_TYPES)}
+
+HISTORY_DAYS = 365
+# Недели давностью в HALF_LIFE_WEEKS весят вдвое меньше текущих
+HALF_LIFE_WEEKS = 8
+
+
+def next_monday(today=None):
+    today = today or timezone.now().date()
+    return today + timedelta(days=7 - today.weekday())
+
+
+def weekday_means(start, end):
+    # Взвешенное среднее числа порций по (день недели, прием пищи) за дни, когда столовая работала.
+    # Читаем дневные счетчики DailyStats, а не строки Attendance: год истории — это сотни строк
+    rows = list(DailyStats.objects.filter(date__gte=start, date__lt=end).values_list('date', 'breakfasts', 'lunches'))
+    if not rows:
+        return np.zeros((7, len(MEAL_TYPES)))
+    days = np.fromiter((row[0].toordinal() for row in rows), dtype=np.int64, count=len(rows))
+    counts = np.array([row[1:] for row in rows], dtype=np.float64)
+    
+    weights = 0.5 ** ((end.toordinal() - days) / 7 / HALF_LIFE_WEEKS)
+    # date.fromordinal(1) — понедельник, поэтому (ordinal - 1) % 7 совпадает с weekday()
+    weekdays = (days - 1) % 7
+    means = np.zeros((7, len(MEAL_TYPES)))
+    for m in range(len(MEAL_TYPES)):
+        served = counts[:, m] > 0
+        total = np.bincount(weekdays[served], weights=weights[served] * counts[served, m], minlength=7)
+        norm = np.bincount(weekdays[served], weights=weights[served], minlength=7)
+        means[:, m] = np.divide(total, norm, out=np.zeros(7), where=norm > 0)
+    return means
+
+
+def active_subscriptions(dates):
+    # Число действующих абонементов на каждый день по каждому приему пищи
+    ordinals = np.array([d.toordinal() for d in dates])
+    result = np.zeros((len(dates), len(MEAL_TYPES)))
+    rows = list(Subscription.objects.filter(end_date__gte=dates[0]).values_list('meal_type', 'end_date'))
+    for meal_type, m in MEAL_INDEX.items():
+        ends = np.sort(np.array([end.toordinal() for kind, end in rows if kind in (meal_type, 'both')], dtype=np.int64))
+        result[:, m] = len(ends) - np.searchsorted(ends, ordinals, side='left')
+    return result
+
+
+def recipe_rows(**filters):
+    # (дата меню, прием пищи, продукт, расход на порцию) для всех блюд выбранных меню
+    rows = list(DishProduct.objects.filter(**filters).values_list(
+        'dish__menu_dishes__menu__date', 'dish__menu_dishes__meal_type', 'product_id', 'quantity'
+    ))
+    days = np.array([row[0].toordinal() for row in rows], dtype=np.int64)
+    meals = np.array([MEAL_INDEX[row[1]] for row in rows], dtype=np.int64)
+    products = np.array([row[2] for row in rows], dtype=np.int64)
+    quantities = np.array([row[3] for row in rows], dtype=np.float64)
+    return days, meals, products, quantities
+
+
+def unit_prices(product_ids, since):
+    # Цена за единицу по одобренным заявкам: МНК для price = Σ amount × цена_продукта
+    applications = list(Applications.objects.filter(status='approved', date__gte=since)
+                        .order_by('id').values_list('id', 'price'))
+    prices = np.zeros(len(product_ids))
+    known = np.zeros(len(product_ids), dtype=bool)
+    if not applications:
+        return prices, known
+    app_ids = np.array([row[0] for row in applications], dtype=np.int64)
+    totals = np.array([row[1] for row in applications], dtype=np.float64)
+    items = list(ApplicationItem.objects.filter(application__status='approved', application__date__gte=since)
+                 .values_list('application_id', 'product_id', 'amount'))
+    if not items:
+        return prices, known
+    item_apps = np.searchsorted(app_ids, [row[0] for row in items])
+    item_products = np.searchsorted(product_ids, [row[1] for row in items])
+    matrix = np.zeros((len(app_ids), len(product_ids)))
+    np.add.at(matrix, (item_apps, item_products), [row[2] for row in items])
+    known = matrix.any(axis=0)
+    solution = np.linalg.lstsq(matrix[:, known], totals, rcond=None)[0]
+    prices[known] = np.clip(solution, 0, None)
+    return prices, known
+
+
+def forecast_week(start=None, today=None):
+    today = today or timezone.now().date()
+    start = start or next_monday(today)
+    dates = [start + timedelta(days=i) for i in range(7)]
+    since = today - timedelta(days=HISTORY_DAYS)
+
+    means = weekday_means(since, today)
+    subscribed = active_subscriptions(dates)
+    history = means[[d.weekday() for d in dates]]
+    # Абонементы задают нижнюю границу, но только в дни, когда столовая обычно работает
+    portions = np.ceil(np.where(history > 0, np.maximum(history, subscribed), 0))
+
+    products = list(Product.objects.order_by('id').values_list('id', 'name', 'amount'))
+    product_ids = np.array([row[0] for row in products], dtype=np.int64)
+    stock = np.array([row[2] for row in products], dtype=np.float64)
+    required = np.zeros(len(products))
+
+    # Запланированные меню: порции дня × рецепты блюд
+    days, meals, items, quantities = recipe_rows(dish__menu_dishes__menu__date__range=(dates[0], dates[-1]))
+    planned = np.zeros(portions.shape, dtype=bool)
+    if len(days):
+        day_idx = days - start.toordinal()
+        planned[day_idx, meals] = True
+        required += np.bincount(np.searchsorted(product_ids, items),
+                                weights=portions[day_idx, meals] * quantities, minlength=len(products))
+
+    # Дни без меню: средний расход на порцию по прошлым меню того же приема пищи
+    unplanned = np.where(planned, 0, portions).sum(axis=0)
+    if unplanned.any():
+        days, meals, items, quantities = recipe_rows(dish__menu_dishes__menu__date__gte=since,
+                                                     dish__menu_dishes__menu__date__lt=today)
+        if len(days):
+            menus = np.zeros(len(MEAL_TYPES))
+            for m in range(len(MEAL_TYPES)):
+                menus[m] = len(np.unique(days[meals == m]))
+            scale = np.divide(unplanned, menus, out=np.zeros(len(MEAL_TYPES)), where=menus > 0)
+            required += np.bincount(np.searchsorted(product_ids, items),
+                                    weights=scale[meals] * quantities, minlength=len(products))
+
+    required = np.ceil(required)
+    need = np.maximum(required - stock, 0)
+    prices, known = unit_prices(product_ids, since)
+
+    return {
+        'start': dates[0],
+        'end': dates[-1],
+        'days': [
+            {'date': d, 'planned': bool(planned[i].any()),
+             **{meal_type: int(portions[i, m]) for meal_type, m in MEAL_INDEX.items()}}
+            for i, d in enumerate(dates)
+        ],
+        'products': [
+            {'id': product_id, 'name': name, 'stock': int(stock[i]), 'required': int(required[i]),
+             'need': int(need[i]), 'unit_price': round(float(prices[i]), 2) if known[i] else None}
+            for i, (product_id, name, _) in enumerate(products) if required[i]
+        ],
+        'price': int(np.ceil(need @ prices)),
+    }
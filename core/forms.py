@@ -1,6 +1,6 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
-from .models import User, Alergen, Reviews, Product, Dish, Menu
+from .models import User, Alergen, Reviews, Product, Dish, DishProduct, Menu
 
 
 class LoginForm(AuthenticationForm):
@@ -50,16 +50,14 @@ class ProfileForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if self.instance and self.instance.alergens:
-            selected_ids = self.instance.get_alergens_list()
-            self.fields['alergens_choices'].initial = Alergen.objects.filter(id__in=selected_ids)
+        if self.instance and self.instance.pk:
+            self.fields['alergens_choices'].initial = self.instance.alergens.all()
     
     def save(self, commit=True):
         user = super().save(commit=False)
-        selected = self.cleaned_data.get('alergens_choices', [])
-        user.alergens = ','.join(str(a.id) for a in selected)
         if commit:
-            user.save()
+            user.save(update_fields=self._meta.fields)
+            user.alergens.set(self.cleaned_data.get('alergens_choices', []))
         return user
 
 
@@ -93,6 +91,10 @@ class SubscriptionForm(forms.Form):
         label='Тип питания',
         widget=forms.Select(attrs={'class': 'form-input'})
     )
+    auto_renew = forms.BooleanField(
+        required=False,
+        label='Продлевать автоматически с баланса'
+    )
 
 
 class ReviewForm(forms.ModelForm):
@@ -128,16 +130,44 @@ class DishForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if self.instance and self.instance.products:
-            selected_ids = self.instance.get_products_list()
-            self.fields['products_choices'].initial = Product.objects.filter(id__in=selected_ids)
+        self.quantities = {}
+        if self.instance and self.instance.pk:
+            self.fields['products_choices'].initial = self.instance.products.all()
+            self.quantities = dict(DishProduct.objects.filter(dish=self.instance).values_list('product_id', 'quantity'))
+    
+    def product_rows(self):
+        # Строки состава для шаблона: продукт, выбран ли он и расход на порцию
+        if self.is_bound:
+            selected = set(self.data.getlist('products_choices'))
+            return [(product, str(product.id) in selected, self.data.get(f'quantity_{product.id}', 1))
+                    for product in self.fields['products_choices'].queryset]
+        return [(product, product.id in self.quantities, self.quantities.get(product.id, 1))
+                for product in self.fields['products_choices'].queryset]
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        quantities = {}
+        for product in cleaned_data.get('products_choices', []):
+            value = self.data.get(f'quantity_{product.id}', '1').strip()
+            if not value.isdigit() or int(value) < 1:
+                self.add_error('products_choices', f'Расход продукта «{product.name}» должен быть целым числом от 1')
+            else:
+                quantities[product.id] = int(value)
+        cleaned_data['quantities'] = quantities
+        return cleaned_data
     
     def save(self, commit=True):
         dish = super().save(commit=False)
-        selected = self.cleaned_data.get('products_choices', [])
-        dish.products = ','.join(str(p.id) for p in selected)
         if commit:
             dish.save()
+            quantities = self.cleaned_data['quantities']
+            dish.products.set(self.cleaned_data.get('products_choices', []))
+            # Расход хранится в промежуточной модели: set() создает строки с расходом по умолчанию
+            links = [link for link in DishProduct.objects.filter(dish=dish)
+                     if link.quantity != quantities.get(link.product_id, link.quantity)]
+            for link in links:
+                link.quantity = quantities[link.product_id]
+            DishProduct.objects.bulk_update(links, ['quantity'])
         return dish
 
 
@@ -165,19 +195,17 @@ class MenuForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance and self.instance.pk:
-            breakfast_ids = [int(x.strip()) for x in self.instance.breakfast.split(',') if x.strip().isdigit()]
-            lunch_ids = [int(x.strip()) for x in self.instance.lunch.split(',') if x.strip().isdigit()]
-            self.fields['breakfast_dishes'].initial = Dish.objects.filter(id__in=breakfast_ids)
-            self.fields['lunch_dishes'].initial = Dish.objects.filter(id__in=lunch_ids)
+            self.fields['breakfast_dishes'].initial = Dish.objects.filter(
+                menu_dishes__menu=self.instance, menu_dishes__meal_type='breakfast')
+            self.fields['lunch_dishes'].initial = Dish.objects.filter(
+                menu_dishes__menu=self.instance, menu_dishes__meal_type='lunch')
     
     def save(self, commit=True):
         menu = super().save(commit=False)
-        breakfast = self.cleaned_data.get('breakfast_dishes', [])
-        lunch = self.cleaned_data.get('lunch_dishes', [])
-        menu.breakfast = ','.join(str(d.id) for d in breakfast)
-        menu.lunch = ','.join(str(d.id) for d in lunch)
         if commit:
             menu.save()
+            menu.set_dishes('breakfast', self.cleaned_data.get('breakfast_dishes', []))
+            menu.set_dishes('lunch', self.cleaned_data.get('lunch_dishes', []))
         return menu
 
 
@@ -199,14 +227,20 @@ class ProductForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if self.instance and self.instance.alergens:
-            selected_ids = self.instance.get_alergens_list()
-            self.fields['alergens_choices'].initial = Alergen.objects.filter(id__in=selected_ids)
+        if self.instance and self.instance.pk:
+            self.fields['alergens_choices'].initial = self.instance.alergens.all()
     
     def save(self, commit=True):
         product = super().save(commit=False)
-        selected = self.cleaned_data.get('alergens_choices', [])
-        product.alergens = ','.join(str(a.id) for a in selected)
         if commit:
             product.save()
+            product.alergens.set(self.cleaned_data.get('alergens_choices', []))
         return product
+
+
+class RosterImportForm(forms.Form):
+    file = forms.FileField(
+        label='CSV-файл',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-input', 'accept': '.csv'})
+    )
+    dry_run = forms.BooleanField(label='Только проверить', required=False, initial=True)
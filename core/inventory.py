@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+
+from .models import Product, DishProduct, Menu
+
+CONSUMED_COUNTERS = {
+    'breakfast': 'consumed_breakfasts_amount',
+    'lunch': 'consumed_lunches_amount',
+}
+
+GIVEN_COUNTERS = {
+    'breakfast': 'given_breakfasts_amount',
+    'lunch': 'given_lunches_amount',
+}
+
+
+def product_usage(menu_id, portions):
+    # Расход продуктов одним агрегатом по рецептам блюд меню: quantity × число порций приема пищи
+    portions = {meal_type: count for meal_type, count in portions.items() if count}
+    if not portions:
+        return {}
+    rows = DishProduct.objects.filter(
+        dish__menu_dishes__menu_id=menu_id, dish__menu_dishes__meal_type__in=list(portions)
+    ).values('product_id').annotate(total=Sum(F('quantity') * Case(
+        *[When(dish__menu_dishes__meal_type=meal_type, then=Value(count)) for meal_type, count in portions.items()],
+        default=Value(0), output_field=IntegerField(),
+    ))).values_list('product_id', 'total')
+    return {product_id: total for product_id, total in rows if total}
+
+
+def apply_usage(usage):
+    if usage:
+        Product.objects.filter(id__in=usage).update(amount=Case(
+            *[When(id=product_id, then=F('amount') - total) for product_id, total in usage.items()],
+            default=F('amount'),
+        ))
+
+
+def consume_portions(menu_id, meal_type, count):
+    # Списание при выдаче; вызывается внутри транзакции выдачи
+    apply_usage(product_usage(menu_id, {meal_type: count}))
+    counter = CONSUMED_COUNTERS[meal_type]
+    Menu.objects.filter(pk=menu_id).update(**{counter: F(counter) + count})
+
+
+def consume_menu(menu_id):
+    # Списание выданных, но еще не списанных порций; повторный запуск ничего не спишет дважды
+    with transaction.atomic():
+        counts = Menu.objects.filter(pk=menu_id).values(*GIVEN_COUNTERS.values(), *CONSUMED_COUNTERS.values()).get()
+        portions = {meal_type: counts[GIVEN_COUNTERS[meal_type]] - counts[CONSUMED_COUNTERS[meal_type]]
+                    for meal_type in GIVEN_COUNTERS}
+        portions = {meal_type: count for meal_type, count in portions.items() if count > 0}
+        if not portions:
+            return {}
+        usage = product_usage(menu_id, portions)
+        apply_usage(usage)
+        Menu.objects.filter(pk=menu_id).update(**{
+            CONSUMED_COUNTERS[meal_type]: F(CONSUMED_COUNTERS[meal_type]) + count
+            for meal_type, count in portions.items()
+        })
+    return usage
+
+
+def pending_menus(until):
+    return Menu.objects.filter(
+        Q(given_breakfasts_amount__gt=F('consumed_breakfasts_amount')) |
+        Q(given_lunches_amount__gt=F('consumed_lunches_amount')),
+        date__lte=until,
+    ).order_by('date')
+
+
+def consume_until(until):
+    totals = {}
+    menus = 0
+    for menu_id in pending_menus(until).values_list('id', flat=True):
+        for product_id, total in consume_menu(menu_id).items():
+            totals[product_id] = totals.get(product_id, 0) + total
+        menus += 1
+    return menus, totals
@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .db import retry_on_locked
+from .models import User, BalanceEntry, BalanceSnapshot
+from .student_status import invalidate_today_status
+
+
+def opening_entries(users):
+    # Для пользователей, созданных через bulk_create с ненулевым балансом
+    return [BalanceEntry(user_id=user.pk, kind='adjustment', amount=user.balance, reference='opening')
+            for user in users if user.balance]
+
+
+def current_balance(user_id):
+    # Последний снимок плюс операции после него; хвост ограничен периодичностью snapshot_balances
+    snapshot = BalanceSnapshot.objects.filter(user_id=user_id).order_by('-entry_id').first()
+    balance, after = (snapshot.balance, snapshot.entry_id) if snapshot else (0, 0)
+    tail = BalanceEntry.objects.filter(user_id=user_id, id__gt=after).aggregate(total=Sum('amount'))['total']
+    return balance + (tail or 0)
+
+
+@retry_on_locked
+def rebuild_balance(user_id):
+    # Журнал — источник истины: хранимый баланс выравнивается по снимку и хвосту операций
+    with transaction.atomic():
+        stored = User.objects.filter(pk=user_id).values_list('balance', flat=True).get()
+        balance = current_balance(user_id)
+        if balance == stored:
+            return False
+        # Условие на прочитанное значение: параллельная операция меняет баланс и журнал вместе, ее не затираем
+        updated = User.objects.filter(pk=user_id, balance=stored).update(balance=balance)
+    invalidate_today_status([user_id])
+    return bool(updated)
+
+
+def take_snapshots(min_entries=1, batch_size=1000):
+    last = BalanceSnapshot.objects.filter(user=OuterRef('pk')).order_by('-entry_id')
+    tail = BalanceEntry.objects.filter(user=OuterRef('pk'), id__gt=OuterRef('snapshot_entry')).order_by().values('user')
+    rows = list(User.objects.annotate(
+        snapshot_entry=Coalesce(Subquery(last.values('entry_id')[:1]), 0),
+        snapshot_balance=Coalesce(Subquery(last.values('balance')[:1]), 0),
+        tail_count=Coalesce(Subquery(tail.annotate(count=Count('id')).values('count')), 0),
+        tail_sum=Coalesce(Subquery(tail.annotate(total=Sum('amount')).values('total')), 0),
+        tail_last=Subquery(tail.annotate(last=Max('id')).values('last')),
+    ).filter(tail_count__gte=max(min_entries, 1)).values_list('id', 'snapshot_balance', 'tail_sum', 'tail_last'))
+    BalanceSnapshot.objects.bulk_create([
+        BalanceSnapshot(user_id=user_id, entry_id=entry_id, balance=balance + tail_sum)
+        for user_id, balance, tail_sum, entry_id in rows
+    ], batch_size=batch_size)
+    return len(rows)
+
+
+class Peekable:
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.head = next(iterator, None)
+
+    def pop(self):
+        item, self.head = self.head, next(self.iterator, None)
+        return item
+
+
+def audit_balances(chunk_size=5000):
+    # Один проход по трем отсортированным потокам: пользователи, операции, снимки
+    users = User.objects.order_by('id').values_list('id', 'login', 'balance').iterator(chunk_size=chunk_size)
+    entries = Peekable(BalanceEntry.objects.order_by('user_id', 'id')
+                       .values_list('user_id', 'id', 'amount').iterator(chunk_size=chunk_size))
+    snapshots = Peekable(BalanceSnapshot.objects.order_by('user_id', 'entry_id')
+                         .values_list('user_id', 'entry_id', 'balance').iterator(chunk_size=chunk_size))
+    
+    for user_id, login, stored in users:
+        total = 0
+        while entries.head and entries.head[0] == user_id:
+            _, entry_id, amount = entries.pop()
+            total += amount
+            while snapshots.head and snapshots.head[0] == user_id and snapshots.head[1] <= entry_id:
+                _, snapshot_entry, snapshot_balance = snapshots.pop()
+                if snapshot_entry == entry_id and snapshot_balance != total:
+                    yield {'user_id': user_id, 'login': login, 'problem': 'snapshot', 'entry_id': entry_id,
+                           'expected': total, 'actual': snapshot_balance}
+                elif snapshot_entry != entry_id:
+                    yield {'user_id': user_id, 'login': login, 'problem': 'snapshot', 'entry_id': snapshot_entry,
+                           'expected': None, 'actual': snapshot_balance}
+        while snapshots.head and snapshots.head[0] == user_id:
+            _, snapshot_entry, snapshot_balance = snapshots.pop()
+            yield {'user_id': user_id, 'login': login, 'problem': 'snapshot', 'entry_id': snapshot_entry,
+                   'expected': None, 'actual': snapshot_balance}
+        if total != stored:
+            yield {'user_id': user_id, 'login': login, 'problem': 'balance', 'entry_id': None,
+                   'expected': total, 'actual': stored}
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.ledger import audit_balances, rebuild_balance
+
+
+class Command(BaseCommand):
+    help = 'Сверяет балансы пользователей и снимки с журналом операций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--limit', type=int, default=50, help='Сколько расхождений печатать')
+        parser.add_argument('--fix', action='store_true',
+                            help='Выровнять расходящиеся балансы по последнему снимку и хвосту журнала')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        problems = 0
+        to_fix, bad_snapshots = [], set()
+        for problem in audit_balances(options['chunk_size']):
+            problems += 1
+            if problem['problem'] == 'balance':
+                to_fix.append(problem['user_id'])
+            else:
+                bad_snapshots.add(problem['user_id'])
+            if problems <= options['limit']:
+                if problem['problem'] == 'balance':
+                    self.stdout.write(f"{problem['login']}: баланс {problem['actual']}, по журналу {problem['expected']}")
+                elif problem['expected'] is None:
+                    self.stdout.write(f"{problem['login']}: снимок на операцию {problem['entry_id']} без операции")
+                else:
+                    self.stdout.write(f"{problem['login']}: снимок на операцию {problem['entry_id']} "
+                                      f"{problem['actual']}, по журналу {problem['expected']}")
+        if options['fix']:
+            # При неверном снимке пересчет от него даст неверный баланс: такие оставляем для разбора
+            fixed = sum(rebuild_balance(user_id) for user_id in to_fix if user_id not in bad_snapshots)
+            self.stdout.write(f'Исправлено балансов: {fixed}')
+            problems -= fixed
+        seconds = time.monotonic() - started
+        if problems:
+            raise CommandError(f'Расхождений: {problems} ({seconds:.2f} с)')
+        self.stdout.write(self.style.SUCCESS(f'Расхождений нет ({seconds:.2f} с)'))
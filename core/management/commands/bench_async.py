@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from core.bench import percentile
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = ('Нагрузка на страницы ученика через ASGI-обработчик с N одновременными запросами. '
+            'Async-представления: DJANGO_ASYNC_VIEWS=1, синхронные: DJANGO_ASYNC_VIEWS=0')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--meal-type', choices=['breakfast', 'lunch'], default='lunch')
+
+    def handle(self, *args, **options):
+        students = list(User.objects.filter(role='student', login__startswith='bench')[:options['students']])
+        if not students:
+            raise CommandError('Нет данных: сначала выполните seed_load')
+        
+        # Сессии создаются заранее, чтобы в замер не попало хеширование паролей
+        cookies = []
+        for student in students:
+            client = Client()
+            client.force_login(student)
+            cookies.append(client.cookies)
+        
+        samples = {}
+        urls = {
+            'student_menu': reverse('student_menu'),
+            'student_menu_json': reverse('student_menu_json'),
+            'student_take_meal': reverse('student_take_meal', args=[options['meal_type']]),
+            'student_payment': reverse('student_payment'),
+        }
+        
+        async def request(client, name, method='get', data=None):
+            started = time.perf_counter()
+            response = await getattr(client, method)(urls[name], data)
+            samples.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+            return response
+        
+        async def student_flow(semaphore, student_cookies):
+            async with semaphore:
+                client = AsyncClient()
+                client.cookies = student_cookies
+                await request(client, 'student_menu')
+                await request(client, 'student_menu_json')
+                await request(client, 'student_take_meal')
+                await request(client, 'student_payment', 'post', {'amount': 100})
+        
+        async def run():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            await asyncio.gather(*(student_flow(semaphore, c) for c in cookies))
+        
+        started = time.perf_counter()
+        asyncio.run(run())
+        duration = time.perf_counter() - started
+        
+        mode = 'async' if settings.ASYNC_VIEWS else 'sync'
+        self.stdout.write(f'Представления: {mode}, одновременно: {options["concurrency"]}')
+        self.stdout.write(f"{'view':<24}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, values in samples.items():
+            self.stdout.write(f'{name:<24}{len(values):>7}{percentile(values, 50):>10.1f}'
+                              f'{percentile(values, 95):>10.1f}{percentile(values, 99):>10.1f}')
+        total = sum(len(values) for values in samples.values())
+        self.stdout.write(f'Всего запросов: {total} за {duration:.1f} с ({total / duration:.1f} req/s)')
@@ -0,0 +1,110 @@
+import queue
+import threading
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.messages import get_messages
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from core.bench import BenchRecorder
+from core.models import User, Menu, Attendance
+from .seed_load import BENCH_PASSWORD
+
+
+class Command(BaseCommand):
+    help = ('Сценарий пикового часа: вход -> меню -> получение питания -> пополнение -> отчеты. '
+            'Запускать на базе, заполненной seed_load')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--meal-type', choices=['breakfast', 'lunch'], default='lunch')
+        parser.add_argument('--reports-every', type=int, default=25,
+                            help='Каждый N-й ученик сопровождается открытием отчетов администратором')
+        parser.add_argument('--force-login', action='store_true',
+                            help='Не измерять вход (без хеширования пароля)')
+        parser.add_argument('--sqlite-profile', choices=sorted(settings.SQLITE_PROFILES),
+                            help='Профиль PRAGMA из SQLITE_PROFILES для сравнения режимов SQLite')
+
+    def handle(self, *args, **options):
+        if options['sqlite_profile']:
+            settings.SQLITE_PRAGMAS = settings.SQLITE_PROFILES[options['sqlite_profile']]
+            connections.close_all()
+        
+        students = list(User.objects.filter(role='student', login__startswith='bench')[:options['students']])
+        admin = User.objects.filter(role='admin').first()
+        if not students or not admin:
+            raise CommandError('Нет данных: сначала выполните seed_load')
+        
+        today = timezone.now().date()
+        meal_type = options['meal_type']
+        counter = 'given_breakfasts_amount' if meal_type == 'breakfast' else 'given_lunches_amount'
+        menu = Menu.objects.filter(date=today).first()
+        given_before = getattr(menu, counter, 0)
+        taken_before = Attendance.objects.filter(date=today, meal_type=meal_type).count()
+        
+        recorder = BenchRecorder()
+        pending = queue.Queue()
+        for i, student in enumerate(students):
+            pending.put((i, student))
+        errors = []
+        
+        def worker():
+            admin_client = Client()
+            admin_client.force_login(admin)
+            while True:
+                try:
+                    i, student = pending.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    client = Client()
+                    if options['force_login']:
+                        client.force_login(student)
+                    else:
+                        with recorder.measure('login'):
+                            client.post(reverse('login'), {'username': student.login, 'password': BENCH_PASSWORD})
+                    with recorder.measure('student_menu'):
+                        response = client.get(reverse('student_menu'))
+                    if response.status_code != 200:
+                        errors.append(f'{student.login}: меню вернуло {response.status_code}')
+                    with recorder.measure('student_take_meal'):
+                        response = client.get(reverse('student_take_meal', args=[meal_type]))
+                    # Вью перехватывает CheckoutError и сообщает о ней через messages
+                    failures = [str(m) for m in get_messages(response.wsgi_request) if m.level == messages.ERROR]
+                    if failures:
+                        errors.append(f'{student.login}: {failures[0]}')
+                    with recorder.measure('student_payment'):
+                        client.post(reverse('student_payment'), {'amount': 100})
+                    if options['reports_every'] and i % options['reports_every'] == 0:
+                        with recorder.measure('admin_reports'):
+                            admin_client.get(reverse('admin_reports'))
+                except Exception as e:
+                    errors.append(f'{student.login}: {e!r}')
+            connections.close_all()
+        
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        recorder.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        recorder.stop()
+        
+        self.stdout.write(recorder.format_report())
+        journal_mode = connections['default'].cursor().execute('PRAGMA journal_mode').fetchone()[0]
+        self.stdout.write(f'journal_mode: {journal_mode}, ошибок: {len(errors)}')
+        
+        menu = Menu.objects.filter(date=today).first()
+        given = getattr(menu, counter, 0) - given_before
+        taken = Attendance.objects.filter(date=today, meal_type=meal_type).count() - taken_before
+        if given == taken:
+            self.stdout.write(self.style.SUCCESS(f'Счетчик меню сходится с посещениями: {given}'))
+        else:
+            self.stdout.write(self.style.ERROR(f'Счетчик меню {given} != посещений {taken}'))
+        for error in errors[:10]:
+            self.stderr.write(error)
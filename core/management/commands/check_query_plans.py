@@ -0,0 +1,126 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from core.models import User, Dish, Menu, Product
+from core.search import SEARCH_FIELDS, filter_queryset
+
+# Таблицы, которые растут вместе с числом учеников и дней
+LARGE_TABLES = {
+    'core_user', 'core_attendance', 'core_payment', 'core_subscription', 'core_applications',
+    'core_applicationitem', 'core_reviews', 'core_menu', 'core_menudish', 'core_dailystats',
+    'core_balanceentry', 'core_balancesnapshot', 'core_notification',
+}
+
+SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def role_pages():
+    dish = Dish.objects.order_by('id').first()
+    menu = Menu.objects.order_by('id').first()
+    product = Product.objects.order_by('id').first()
+    return {
+        'student': [
+            '/student/menu/', '/student/menu.json', '/student/payment/', '/student/subscription/',
+            '/student/reviews/', f'/student/reviews/add/{dish.id}/', '/student/balance/', '/profile/',
+        ],
+        'cook': [
+            '/cook/', '/cook/menu/', '/cook/menu/plan/', f'/cook/menu/{menu.id}/edit/', '/cook/dishes/', '/cook/dishes/?q=суп',
+            f'/cook/dishes/{dish.id}/edit/', '/cook/products/', f'/cook/products/{product.id}/edit/',
+            '/cook/applications/', '/cook/applications/create/', '/cook/applications/create/?forecast=1', '/cook/serve/', '/cook/kiosk/snapshot/',
+            '/search/?kind=dish&q=суп',
+        ],
+        'admin': [
+            '/admin-panel/', '/admin-panel/applications/', '/admin-panel/applications/?status=pending',
+            '/admin-panel/statistics/', '/admin-panel/reports/', '/admin-panel/users/',
+            '/admin-panel/users/?role=student', '/admin-panel/users/?q=иван', '/admin-panel/alergens/',
+            '/admin-panel/reports/export/payments/', '/admin-panel/reports/export/attendance/',
+            '/admin-panel/reports/export/subscriptions/', '/admin-panel/reports/export/applications/',
+            '/search/?kind=user&q=иван',
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = ('Открывает страницы каждой роли, выполняет EXPLAIN QUERY PLAN для всех SELECT '
+            'и завершается с ошибкой при полном сканировании больших таблиц. '
+            'На PostgreSQL проверяет, что поиск использует триграммные индексы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Печатать планы всех запросов')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'postgresql':
+            return self.check_trigram_indexes(options['verbose_plans'])
+        if connection.vendor != 'sqlite':
+            raise CommandError('Проверка планов написана для SQLite и PostgreSQL')
+        
+        problems = []
+        checked = 0
+        for role, pages in role_pages().items():
+            user = User.objects.filter(role=role, is_active=True).order_by('id').first()
+            if user is None:
+                raise CommandError(f'Нет пользователя с ролью {role}')
+            client = Client()
+            client.force_login(user)
+            for url in pages:
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.get(url)
+                    if getattr(response, 'streaming', False):
+                        b''.join(response.streaming_content)
+                if response.status_code not in (200, 302):
+                    problems.append(f'{url}: ответ {response.status_code}')
+                    continue
+                for query in captured.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    checked += 1
+                    for table, plan in self.full_scans(sql):
+                        problems.append(f'{url}: SCAN {table}\n    {sql[:300]}')
+                    if options['verbose_plans']:
+                        self.stdout.write(f'{url}\n  {sql[:200]}\n  ' + '\n  '.join(self.plan(sql)))
+        
+        self.stdout.write(f'Проверено запросов: {checked}')
+        if problems:
+            for problem in dict.fromkeys(problems):
+                self.stderr.write(problem)
+            raise CommandError(f'Полное сканирование больших таблиц: {len(set(problems))}')
+        self.stdout.write(self.style.SUCCESS('Полных сканирований больших таблиц нет'))
+
+    def check_trigram_indexes(self, verbose):
+        # На PostgreSQL поиск идет через icontains: план каждого вида поиска должен задействовать
+        # триграммные индексы всех его полей. Seq scan запрещаем, иначе на маленькой базе индекс не выберут
+        problems = []
+        for kind, (model, fields) in SEARCH_FIELDS.items():
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = filter_queryset(model.objects.all(), kind, 'иван').explain()
+            if verbose:
+                self.stdout.write(f'{kind}\n  ' + plan.replace('\n', '\n  '))
+            table = model._meta.db_table
+            for field in fields:
+                if f'{table}_{field}_trgm' not in plan:
+                    problems.append(f'{kind}: не используется индекс {table}_{field}_trgm\n    {plan}')
+        self.stdout.write(f'Проверено видов поиска: {len(SEARCH_FIELDS)}')
+        if problems:
+            for problem in problems:
+                self.stderr.write(problem)
+            raise CommandError(f'Поиск без триграммных индексов: {len(problems)}')
+        self.stdout.write(self.style.SUCCESS('Поиск использует триграммные индексы'))
+
+    def plan(self, sql):
+        # CaptureQueriesContext хранит SQL с подставленными параметрами
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def full_scans(self, sql):
+        for line in self.plan(sql):
+            match = SCAN_RE.match(line.strip())
+            if match and match.group(1) in LARGE_TABLES:
+                yield match.group(1), line
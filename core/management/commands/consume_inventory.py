@@ -0,0 +1,26 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.inventory import consume_until
+from core.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Списывает со склада продукты по рецептам блюд для выданных, но еще не списанных порций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Списать по меню до этой даты включительно (ГГГГ-ММ-ДД), по умолчанию сегодня')
+
+    def handle(self, *args, **options):
+        until = datetime.strptime(options['date'], '%Y-%m-%d').date() if options['date'] else timezone.now().date()
+        started = time.monotonic()
+        menus, totals = consume_until(until)
+        names = dict(Product.objects.filter(id__in=totals).values_list('id', 'name'))
+        for product_id, total in sorted(totals.items(), key=lambda item: -item[1]):
+            self.stdout.write(f'{names.get(product_id, product_id)}: -{total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Меню: {menus}, продуктов: {len(totals)} за {time.monotonic() - started:.2f} с'
+        ))
@@ -0,0 +1,28 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from core.forecast import forecast_week
+
+
+class Command(BaseCommand):
+    help = 'Прогноз порций и продуктов на неделю по истории посещений, абонементам и меню'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Первый день прогноза (ГГГГ-ММ-ДД), по умолчанию следующий понедельник')
+
+    def handle(self, *args, **options):
+        start = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] else None
+        started = time.monotonic()
+        forecast = forecast_week(start)
+        seconds = time.monotonic() - started
+        
+        for day in forecast['days']:
+            planned = '' if day['planned'] else ' (без меню)'
+            self.stdout.write(f"{day['date']:%a %d.%m}: завтраков {day['breakfast']}, обедов {day['lunch']}{planned}")
+        for item in forecast['products']:
+            if item['need']:
+                self.stdout.write(f"{item['name']}: нужно {item['required']}, остаток {item['stock']}, "
+                                  f"докупить {item['need']}")
+        self.stdout.write(self.style.SUCCESS(f"Оценка заявки: {forecast['price']} руб. ({seconds:.3f} с)"))
@@ -0,0 +1,48 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.roster import read_roster, validate_roster, import_roster, RosterError
+
+
+class Command(BaseCommand):
+    help = 'Импортирует список учеников из CSV (login, email, name, birth_date, alergens, balance, password)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к CSV-файлу')
+        parser.add_argument('--dry-run', action='store_true', help='Проверить файл без записи в базу')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Процессов для хеширования паролей (по умолчанию по числу CPU)')
+        parser.add_argument('--credentials', help='Куда сохранить сгенерированные пароли (CSV)')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as f:
+                records = read_roster(f)
+            rows = validate_roster(records)
+        except OSError as e:
+            raise CommandError(f'Не удалось прочитать файл: {e}')
+        except RosterError as e:
+            for error in e.errors:
+                self.stderr.write(error)
+            raise CommandError(str(e))
+        
+        result = import_roster(rows, dry_run=options['dry_run'],
+                               batch_size=options['batch_size'], workers=options['workers'])
+        
+        if options['credentials'] and result['credentials'] and not result['dry_run']:
+            with open(options['credentials'], 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['login', 'password'])
+                writer.writerows(result['credentials'])
+        
+        verb = 'Проверено' if result['dry_run'] else 'Создано'
+        count = result['rows'] if result['dry_run'] else result['created']
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} учеников: {count} за {result['seconds']:.2f} с ({result['rate']:.0f} строк/с)"
+        ))
+        if result['credentials'] and not options['credentials'] and not result['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f"Сгенерировано паролей: {len(result['credentials'])}, укажите --credentials, чтобы сохранить их"
+            ))
@@ -0,0 +1,40 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.subscriptions import renew_due, expire_due, queue_low_balance
+
+
+class Command(BaseCommand):
+    help = 'Продлевает абонементы с автопродлением, закрывает истекшие и предупреждает о нехватке средств'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Дата обработки (ГГГГ-ММ-ДД), по умолчанию сегодня')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Абонементов в одной транзакции')
+
+    def handle(self, *args, **options):
+        today = datetime.strptime(options['date'], '%Y-%m-%d').date() if options['date'] else timezone.now().date()
+        batch_size = options['batch_size']
+
+        # Сначала продление: истечь должны только те, кого продлить не удалось
+        started = time.monotonic()
+        processed, renewed, failed = renew_due(today, batch_size)
+        self.report('Продлено', renewed, processed, started)
+        if failed:
+            self.stderr.write(self.style.WARNING(
+                f'Не продлено из-за конфликтов: {len(failed)} абонементов, оставлены до следующего запуска'))
+
+        started = time.monotonic()
+        expired = expire_due(today, batch_size, skip=failed)
+        self.report('Истекло', expired, expired, started)
+
+        started = time.monotonic()
+        queued = queue_low_balance(today, batch_size)
+        self.report('Предупреждений о балансе', queued, queued, started)
+
+    def report(self, label, count, processed, started):
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f'{label}: {count} за {elapsed:.2f} с ({rate:.0f} абонементов/с)'))
@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.stats import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневную статистику из платежей, посещений и заявок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Начальная дата (ГГГГ-ММ-ДД)')
+        parser.add_argument('--end', help='Конечная дата (ГГГГ-ММ-ДД)')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError:
+            raise CommandError('Дата должна быть в формате ГГГГ-ММ-ДД')
+        
+        count = rebuild_daily_stats(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано дней: {count}'))
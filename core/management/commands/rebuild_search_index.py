@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс пользователей, блюд и продуктов'
+
+    def handle(self, *args, **options):
+        counts = rebuild_index()
+        for kind, count in counts.items():
+            self.stdout.write(f'{kind}: {count}')
+        self.stdout.write(self.style.SUCCESS('Индекс перестроен'))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.menu_cache import invalidate_menu_cache
+from core.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает агрегаты оценок блюд (число, сумма, распределение, среднее) по таблице отзывов'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        changed = recompute_ratings()
+        if changed:
+            invalidate_menu_cache()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено блюд: {changed} за {time.monotonic() - started:.2f} с'
+        ))
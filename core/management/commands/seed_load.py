@@ -0,0 +1,152 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import (User, Alergen, Product, Dish, DishProduct, Menu, MenuDish, Attendance, Payment,
+                         Subscription, Applications, ApplicationItem, Reviews, BalanceEntry, alergens_to_mask)
+from core.ledger import opening_entries
+from core.menu_cache import invalidate_menu_cache
+from core.planner import invalidate_histogram
+from core.ratings import recompute_ratings
+from core.search import index_objects
+from core.stats import rebuild_daily_stats
+
+BENCH_PASSWORD = 'bench123'
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу объемами для нагрузочного тестирования (запускать на отдельной базе)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--products', type=int, default=150)
+        parser.add_argument('--dishes', type=int, default=300)
+        parser.add_argument('--attendance-rate', type=float, default=0.7)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        today = timezone.now().date()
+        days = [today - timedelta(days=i) for i in range(options['days'], -1, -1)]
+        started = time.monotonic()
+        
+        call_command('setup_demo', stdout=self.stdout)
+        alergen_ids = list(Alergen.objects.values_list('id', flat=True))
+        
+        with transaction.atomic():
+            Product.objects.bulk_create([
+                Product(name=f'Продукт {i}', amount=rng.randint(0, 500)) for i in range(options['products'])
+            ])
+            products = list(Product.objects.order_by('-id')[:options['products']])
+            Product.alergens.through.objects.bulk_create([
+                Product.alergens.through(product_id=p.id, alergen_id=a)
+                for p in products for a in rng.sample(alergen_ids, rng.choice([0, 0, 0, 1, 2]))
+            ], batch_size=batch_size)
+            index_objects('product', products)
+            product_alergens = {}
+            for product_id, alergen_id in Product.alergens.through.objects.values_list('product_id', 'alergen_id'):
+                product_alergens.setdefault(product_id, []).append(alergen_id)
+            
+            Dish.objects.bulk_create([
+                Dish(name=f'Блюдо {i}', amount=100000, price=rng.randint(20, 120)) for i in range(options['dishes'])
+            ])
+            dishes = list(Dish.objects.order_by('-id')[:options['dishes']])
+            index_objects('dish', dishes)
+            links = []
+            for dish in dishes:
+                for product in rng.sample(products, rng.randint(1, 4)):
+                    links.append(DishProduct(dish=dish, product=product))
+                    dish.alergens_mask |= alergens_to_mask(product_alergens.get(product.id, []))
+            DishProduct.objects.bulk_create(links, batch_size=batch_size)
+            Dish.objects.bulk_update(dishes, ['alergens_mask'], batch_size=batch_size)
+            self.stdout.write(f'Продуктов: {len(products)}, блюд: {len(dishes)}')
+            
+            # Сегодняшнее меню из setup_demo заменяем: его блюд на пиковый час не хватит
+            existing = set(Menu.objects.filter(date__in=days).exclude(date=today).values_list('date', flat=True))
+            MenuDish.objects.filter(menu__date=today).delete()
+            Menu.objects.bulk_create([Menu(date=d) for d in days if d not in existing], batch_size=batch_size,
+                                     ignore_conflicts=True)
+            menus = list(Menu.objects.filter(date__in=[d for d in days if d not in existing]))
+            MenuDish.objects.bulk_create([
+                MenuDish(menu=menu, dish=dish, meal_type=meal_type)
+                for menu in menus for meal_type in ('breakfast', 'lunch')
+                for dish in rng.sample(dishes, 3)
+            ], batch_size=batch_size)
+            invalidate_menu_cache()
+            self.stdout.write(f'Меню: {len(menus)}')
+            
+            password = make_password(BENCH_PASSWORD)
+            offset = User.objects.filter(login__startswith='bench').count()
+            users = []
+            users_alergens = []
+            for i in range(offset, offset + options['students']):
+                users_alergens.append(rng.sample(alergen_ids, rng.choice([0, 0, 0, 0, 1, 2])))
+                users.append(User(login=f'bench{i}', email=f'bench{i}@school.ru', name=f'Нагрузочный Ученик {i}',
+                                  password=password, balance=rng.randint(0, 5000),
+                                  alergens_mask=alergens_to_mask(users_alergens[-1])))
+            User.objects.bulk_create(users, batch_size=batch_size)
+            ids = dict(User.objects.filter(login__in=[u.login for u in users]).values_list('login', 'id'))
+            for user in users:
+                user.pk = ids[user.login]
+            User.alergens.through.objects.bulk_create([
+                User.alergens.through(user_id=u.pk, alergen_id=a)
+                for u, user_alergens in zip(users, users_alergens) for a in user_alergens
+            ], batch_size=batch_size)
+            index_objects('user', users)
+            BalanceEntry.objects.bulk_create(opening_entries(users), batch_size=batch_size)
+            invalidate_histogram()
+            self.stdout.write(f'Учеников: {len(users)}')
+        
+        rate = options['attendance_rate']
+        attendance = payments = 0
+        for day in days[:-1]:
+            if day.weekday() >= 5:
+                continue
+            rows = [
+                Attendance(user_id=u.pk, date=day, meal_type=meal_type, price=rng.choice([0, 150]))
+                for u in users for meal_type in ('breakfast', 'lunch') if rng.random() < rate
+            ]
+            Attendance.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+            attendance += len(rows)
+            rows = [Payment(user_id=u.pk, amount=rng.choice([200, 500, 1000])) for u in users if rng.random() < 0.05]
+            Payment.objects.bulk_create(rows, batch_size=batch_size)
+            # date заполняется auto_now_add, переносим платежи на нужный день
+            Payment.objects.filter(id__in=[p.id for p in rows]).update(date=day)
+            payments += len(rows)
+        self.stdout.write(f'Посещений: {attendance}, платежей: {payments}')
+        
+        Subscription.objects.bulk_create([
+            Subscription(user_id=u.pk, duration=30, end_date=today + timedelta(days=rng.randint(-30, 30)),
+                         meal_type=rng.choice(['breakfast', 'lunch', 'both']))
+            for u in users if rng.random() < 0.3
+        ], batch_size=batch_size)
+        Reviews.objects.bulk_create([
+            Reviews(user_id=u.pk, dish=dish, review=rng.randint(1, 5))
+            for u in users for dish in rng.sample(dishes, 2) if rng.random() < 0.5
+        ], batch_size=batch_size, ignore_conflicts=True)
+        # bulk_create не отправляет сигналы отзывов, агрегаты оценок пересчитываем целиком
+        recompute_ratings()
+        
+        cook = User.objects.filter(role='cook').first()
+        for day in days[::7]:
+            application = Applications.objects.create(user=cook, price=rng.randint(1000, 20000),
+                                                      status=rng.choice(['approved', 'approved', 'rejected']))
+            Applications.objects.filter(pk=application.pk).update(date=day)
+            ApplicationItem.objects.bulk_create([
+                ApplicationItem(application=application, product=p, amount=rng.randint(5, 50))
+                for p in rng.sample(products, 5)
+            ])
+        
+        rebuild_daily_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с. Пароль учеников bench*: {BENCH_PASSWORD}'
+        ))
@@ -9,43 +9,51 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write('Создание демо-данных...')
         
-        alergens = ['Глютен', 'Молочные продукты', 'Орехи', 'Яйца', 'Рыба', 'Соя']
-        for name in alergens:
-            Alergen.objects.get_or_create(name=name)
+        alergens = {}
+        for name in ['Глютен', 'Молочные продукты', 'Орехи', 'Яйца', 'Рыба', 'Соя']:
+            alergens[name], _ = Alergen.objects.get_or_create(name=name)
         
         products_data = [
-            ('Молоко', '2', 50),
-            ('Мука', '1', 30),
-            ('Яйца', '4', 100),
-            ('Масло сливочное', '2', 20),
-            ('Курица', '', 25),
-            ('Рис', '', 40),
-            ('Овощи', '', 60),
-            ('Хлеб', '1', 50),
-            ('Сыр', '2', 15),
-            ('Макароны', '1', 35),
+            ('Молоко', ['Молочные продукты'], 50),
+            ('Мука', ['Глютен'], 30),
+            ('Яйца', ['Яйца'], 100),
+            ('Масло сливочное', ['Молочные продукты'], 20),
+            ('Курица', [], 25),
+            ('Рис', [], 40),
+            ('Овощи', [], 60),
+            ('Хлеб', ['Глютен'], 50),
+            ('Сыр', ['Молочные продукты'], 15),
+            ('Макароны', ['Глютен'], 35),
         ]
-        for name, alergens_ids, amount in products_data:
-            Product.objects.get_or_create(name=name, defaults={'alergens': alergens_ids, 'amount': amount})
+        products = {}
+        for name, alergens_names, amount in products_data:
+            product, created = Product.objects.get_or_create(name=name, defaults={'amount': amount})
+            if created:
+                product.alergens.set([alergens[a] for a in alergens_names])
+            products[name] = product
         
         dishes_data = [
-            ('Каша овсяная', '1,2,4', 30, 50),
-            ('Омлет', '3,4', 20, 60),
-            ('Бутерброд с сыром', '8,9', 15, 40),
-            ('Куриный суп', '5,7', 25, 80),
-            ('Рис с курицей', '5,6', 20, 90),
-            ('Макароны с сыром', '9,10', 18, 70),
-            ('Салат овощной', '7', 22, 50),
-            ('Компот', '', 50, 30),
+            ('Каша овсяная', ['Молоко', 'Мука', 'Масло сливочное'], 30, 50),
+            ('Омлет', ['Яйца', 'Масло сливочное'], 20, 60),
+            ('Бутерброд с сыром', ['Хлеб', 'Сыр'], 15, 40),
+            ('Куриный суп', ['Курица', 'Овощи'], 25, 80),
+            ('Рис с курицей', ['Курица', 'Рис'], 20, 90),
+            ('Макароны с сыром', ['Сыр', 'Макароны'], 18, 70),
+            ('Салат овощной', ['Овощи'], 22, 50),
+            ('Компот', [], 50, 30),
         ]
-        for name, products, amount, price in dishes_data:
-            Dish.objects.get_or_create(name=name, defaults={'products': products, 'amount': amount, 'price': price})
+        dishes = {}
+        for name, products_names, amount, price in dishes_data:
+            dish, created = Dish.objects.get_or_create(name=name, defaults={'amount': amount, 'price': price})
+            if created:
+                dish.products.set([products[p] for p in products_names])
+            dishes[name] = dish
         
         today = timezone.now().date()
-        Menu.objects.get_or_create(
-            date=today,
-            defaults={'breakfast': '1,2,3,8', 'lunch': '4,5,7,8'}
-        )
+        menu, created = Menu.objects.get_or_create(date=today)
+        if created:
+            menu.set_dishes('breakfast', [dishes[d] for d in ['Каша овсяная', 'Омлет', 'Бутерброд с сыром', 'Компот']])
+            menu.set_dishes('lunch', [dishes[d] for d in ['Куриный суп', 'Рис с курицей', 'Салат овощной', 'Компот']])
         
         if not User.objects.filter(login='admin').exists():
             User.objects.create_superuser(
@@ -59,10 +67,11 @@ class Command(BaseCommand):
             )
         
         if not User.objects.filter(login='student').exists():
-            User.objects.create_user(
+            student = User.objects.create_user(
                 login='student', email='student@school.ru', password='student123',
-                name='Петров Иван Сергеевич', role='student', balance=500, alergens='2,3'
+                name='Петров Иван Сергеевич', role='student', balance=500
             )
+            student.alergens.set([alergens['Молочные продукты'], alergens['Орехи']])
         
         self.stdout.write(self.style.SUCCESS('Демо-данные созданы'))
         self.stdout.write('Учетные записи: admin/admin123, cook/cook123, student/student123')
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет снимки балансов, чтобы текущий баланс считался по короткому хвосту журнала'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-entries', type=int, default=1,
+                            help='Снимать только пользователей с таким числом новых операций')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = take_snapshots(options['min_entries'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Снимков: {count} за {time.monotonic() - started:.2f} с'
+        ))
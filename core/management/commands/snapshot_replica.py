@@ -0,0 +1,38 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файл реплики (DJANGO_REPLICA_DB) через backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Повторять каждые N секунд (0 — один снимок)')
+
+    def handle(self, *args, **options):
+        if settings.DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Снимки поддерживаются только для SQLite')
+        if not settings.REPLICA_DB:
+            raise CommandError('Не задан путь к реплике: DJANGO_REPLICA_DB')
+        
+        while True:
+            started = time.monotonic()
+            self.snapshot(str(settings.DATABASES['default']['NAME']), settings.REPLICA_DB)
+            self.stdout.write(f'Снимок готов за {time.monotonic() - started:.2f} с')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def snapshot(self, source_path, replica_path):
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(replica_path, timeout=30)
+        try:
+            source.backup(target)
+            # backup копирует и режим WAL; читателям с mode=ro нужен обычный журнал
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+            source.close()
@@ -0,0 +1,88 @@
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from core.menu_cache import get_daily_menu
+from core.models import User, Dish, Attendance, BalanceEntry
+from core.services import take_meal, CheckoutError
+
+
+class Command(BaseCommand):
+    help = ('Одновременные попытки одного ученика получить одно и то же питание: проверяет, что баланс '
+            'списан ровно один раз и посещение записано одно. Запускать на отдельной файловой базе SQLite')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--meal-type', choices=['breakfast', 'lunch'], default='lunch')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise CommandError('Нужна файловая база: у каждого потока в памяти была бы своя')
+
+        today = timezone.now().date()
+        meal_type = options['meal_type']
+        menu = get_daily_menu(today)
+        if not menu or not menu[meal_type]:
+            raise CommandError('Нет меню на сегодня: сначала выполните setup_demo')
+        dish_ids = [d['id'] for d in menu[meal_type]]
+        price = sum(d['price'] for d in menu[meal_type])
+        # Запас порций, чтобы проверка не упиралась в склад
+        Dish.objects.filter(id__in=dish_ids, amount__lt=options['rounds']).update(amount=options['rounds'])
+
+        offset = User.objects.filter(login__startswith='stress').count()
+        problems = []
+        locked = 0
+        for n in range(offset, offset + options['rounds']):
+            student = User.objects.create(login=f'stress{n}', email=f'stress{n}@school.ru',
+                                          name=f'Проверочный Ученик {n}', role='student', password='!')
+            # Пополнение через ledger, чтобы audit_balances сходился и после проверки
+            User.objects.filter(pk=student.pk).update(balance=price)
+            BalanceEntry.objects.create(user=student, kind='adjustment', amount=price, reference='stress')
+            stock_before = dict(Dish.objects.filter(id__in=dish_ids).values_list('id', 'amount'))
+
+            barrier = threading.Barrier(options['threads'])
+            outcomes = []
+
+            def attempt():
+                user = User.objects.get(pk=student.pk)
+                barrier.wait()
+                try:
+                    take_meal(user, meal_type, today)
+                    outcomes.append('ok')
+                except CheckoutError:
+                    outcomes.append('rejected')
+                except Exception as e:
+                    outcomes.append(repr(e))
+                finally:
+                    connections.close_all()
+
+            threads = [threading.Thread(target=attempt) for _ in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            successes = outcomes.count('ok')
+            locked += len(outcomes) - successes - outcomes.count('rejected')
+            balance = User.objects.filter(pk=student.pk).values_list('balance', flat=True).get()
+            visits = Attendance.objects.filter(user=student, date=today, meal_type=meal_type).count()
+            debits = BalanceEntry.objects.filter(user=student, kind='meal').count()
+            stock_after = dict(Dish.objects.filter(id__in=dish_ids).values_list('id', 'amount'))
+            served = {dish_id: stock_before[dish_id] - stock_after[dish_id] for dish_id in dish_ids}
+            if successes != 1 or visits != 1 or debits != 1 or balance != 0:
+                problems.append(f'{student.login}: успешных {successes}, посещений {visits}, '
+                                f'списаний {debits}, остаток баланса {balance}, исходы {outcomes}')
+            elif any(count != 1 for count in served.values()):
+                # Раунды идут по очереди, поэтому расход — ровно порция каждого блюда
+                problems.append(f'{student.login}: списано порций {served}')
+
+        self.stdout.write(f'Раундов: {options["rounds"]}, потоков: {options["threads"]}, '
+                          f'прочих ошибок (блокировки): {locked}')
+        if problems:
+            for problem in problems[:10]:
+                self.stderr.write(problem)
+            raise CommandError(f'Нарушений: {len(problems)}')
+        self.stdout.write(self.style.SUCCESS('Каждый ученик получил питание один раз, баланс списан один раз'))
@@ -0,0 +1,56 @@
+import time
+
+from django.core.cache import cache
+
+from .models import Menu
+
+MENU_VERSION_KEY = 'menu:version'
+MENU_TIMEOUT = 60 * 60 * 24
+
+
+def get_menu_version():
+    version = cache.get(MENU_VERSION_KEY)
+    if version is None:
+        # Начальная версия от времени, чтобы не подхватить записи, пережившие вытеснение ключа версии
+        cache.add(MENU_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(MENU_VERSION_KEY)
+    return version
+
+
+def invalidate_menu_cache():
+    try:
+        cache.incr(MENU_VERSION_KEY)
+    except ValueError:
+        cache.set(MENU_VERSION_KEY, time.time_ns(), None)
+
+
+def serialize_dish(dish):
+    return {
+        'id': dish.id,
+        'name': dish.name,
+        'price': dish.price,
+        'alergens_mask': dish.alergens_mask,
+        'rating_avg': dish.rating_avg,
+        'rating_count': dish.rating_count,
+    }
+
+
+def build_daily_menu(date):
+    menu = Menu.objects.filter(date=date).prefetch_related('menu_dishes__dish').first()
+    if not menu:
+        return None
+    return {
+        'id': menu.id,
+        'date': menu.date,
+        'breakfast': [serialize_dish(d) for d in menu.get_breakfast_dishes()],
+        'lunch': [serialize_dish(d) for d in menu.get_lunch_dishes()],
+    }
+
+
+def get_daily_menu(date):
+    key = f'menu:{get_menu_version()}:{date.isoformat()}'
+    data = cache.get(key)
+    if data is None:
+        data = build_daily_menu(date) or {}
+        cache.set(key, data, MENU_TIMEOUT)
+    return data or None
@@ -0,0 +1,190 @@
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template as BackendTemplate
+
+from .bench import percentile
+
+current_stats = ContextVar('current_query_stats', default=None)
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+VALUES_RE = re.compile(r'VALUES (?:\([^)]*\), )+\([^)]*\)')
+
+
+def fingerprint(sql):
+    # Запросы, отличающиеся только числом параметров в IN/VALUES, считаем одинаковыми
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return VALUES_RE.sub('VALUES (...)', sql)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+
+class QueryStatsRegistry:
+    def __init__(self, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def add(self, view, total_time, stats):
+        with self.lock:
+            entry = self.views.get(view)
+            if entry is None:
+                entry = self.views[view] = {
+                    'samples': deque(maxlen=self.window),
+                    'duplicates': Counter(),
+                    'requests': 0,
+                }
+            entry['requests'] += 1
+            entry['samples'].append((total_time, stats.queries, stats.sql_time, stats.template_time))
+            entry['duplicates'].update(stats.duplicates())
+
+    def snapshot(self):
+        with self.lock:
+            views = {view: (list(entry['samples']), entry['duplicates'].most_common(5), entry['requests'])
+                     for view, entry in self.views.items()}
+        result = []
+        for view, (samples, duplicates, requests) in views.items():
+            total = [s[0] * 1000 for s in samples]
+            queries = [s[1] for s in samples]
+            result.append({
+                'view': view,
+                'requests': requests,
+                'window': len(samples),
+                'queries_avg': round(sum(queries) / len(queries), 1),
+                'queries_max': max(queries),
+                'time_p50_ms': round(percentile(total, 50), 1),
+                'time_p95_ms': round(percentile(total, 95), 1),
+                'sql_avg_ms': round(sum(s[2] for s in samples) * 1000 / len(samples), 1),
+                'template_avg_ms': round(sum(s[3] for s in samples) * 1000 / len(samples), 1),
+                'duplicates': [{'sql': sql, 'count': count} for sql, count in duplicates],
+            })
+        result.sort(key=lambda row: row['queries_max'], reverse=True)
+        return result
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+
+registry = QueryStatsRegistry(getattr(settings, 'QUERY_STATS_WINDOW', 500))
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+# Обертка ставится на каждое соединение: асинхронные представления ходят в базу
+# из потоков sync_to_async, а контекст запроса приходит туда через contextvars
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # Время шаблонов считаем на уровне бэкенда, а не подменой Template.render для всего процесса.
+    # include/extends рендерятся внутри, поэтому учитывается только внешний шаблон
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class TimedTemplate(BackendTemplate):
+    def render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+
+def show_headers(request):
+    # Заголовки раскрывают устройство запросов, поэтому только для персонала
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and (user.is_staff or user.role == 'admin'))
+
+
+class QueryStatsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.headers = getattr(settings, 'QUERY_STATS_HEADERS', settings.DEBUG)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(None, connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, started, self.headers and show_headers(request))
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        # request.user ленивый и ходит в базу, в async-контексте его читаем через поток
+        headers = self.headers and await sync_to_async(show_headers)(request)
+        return self.finish(request, response, stats, started, headers)
+
+    def finish(self, request, response, stats, started, headers):
+        total_time = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.view_name if match else None) or 'unresolved'
+        registry.add(view, total_time, stats)
+
+        if headers:
+            response['X-Query-Count'] = str(stats.queries)
+            response['X-Query-Time-Ms'] = f'{stats.sql_time * 1000:.1f}'
+            response['X-Query-Duplicates'] = str(sum(count - 1 for count in stats.duplicates().values()))
+            response['X-Template-Time-Ms'] = f'{stats.template_time * 1000:.1f}'
+            response['X-View-Time-Ms'] = f'{total_time * 1000:.1f}'
+        return response
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+def parse_ids(value):
+    return [int(x.strip()) for x in (value or '').split(',') if x.strip().isdigit()]
+
+
+def fill_alergens_mask(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    Dish = apps.get_model('core', 'Dish')
+
+    product_masks = {}
+    for product in Product.objects.only('id', 'alergens'):
+        mask = 0
+        for alergen_id in parse_ids(product.alergens):
+            mask |= 1 << ((alergen_id - 1) % 63)
+        product_masks[product.id] = mask
+
+    dishes = list(Dish.objects.only('id', 'products'))
+    for dish in dishes:
+        dish.alergens_mask = 0
+        for product_id in parse_ids(dish.products):
+            dish.alergens_mask |= product_masks.get(product_id, 0)
+    Dish.objects.bulk_update(dishes, ['alergens_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_applications_amount_of_products_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='alergens_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска аллергенов'),
+        ),
+        migrations.RunPython(fill_alergens_mask, migrations.RunPython.noop),
+    ]
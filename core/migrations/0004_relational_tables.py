@@ -0,0 +1,226 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def parse_ids(value):
+    return [int(x.strip()) for x in (value or '').split(',') if x.strip().isdigit()]
+
+
+def forwards(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    Alergen = apps.get_model('core', 'Alergen')
+    Product = apps.get_model('core', 'Product')
+    Dish = apps.get_model('core', 'Dish')
+    DishProduct = apps.get_model('core', 'DishProduct')
+    Menu = apps.get_model('core', 'Menu')
+    MenuDish = apps.get_model('core', 'MenuDish')
+    Applications = apps.get_model('core', 'Applications')
+    ApplicationItem = apps.get_model('core', 'ApplicationItem')
+
+    alergen_ids = set(Alergen.objects.values_list('id', flat=True))
+    product_ids = set(Product.objects.values_list('id', flat=True))
+    dish_ids = set(Dish.objects.values_list('id', flat=True))
+
+    UserAlergen = User.alergens.through
+    rows = []
+    masks = {}
+    for user_id, value in User.objects.values_list('id', 'alergens_old').iterator():
+        ids = [i for i in dict.fromkeys(parse_ids(value)) if i in alergen_ids]
+        rows.extend(UserAlergen(user_id=user_id, alergen_id=i) for i in ids)
+        mask = 0
+        for i in ids:
+            mask |= 1 << ((i - 1) % 63)
+        if mask:
+            masks.setdefault(mask, []).append(user_id)
+    UserAlergen.objects.bulk_create(rows, batch_size=1000)
+    # Различных масок мало: один UPDATE на маску (пачками id), а не на пользователя
+    for mask, user_ids in masks.items():
+        for start in range(0, len(user_ids), 500):
+            User.objects.filter(id__in=user_ids[start:start + 500]).update(alergens_mask=mask)
+
+    ProductAlergen = Product.alergens.through
+    rows = []
+    for product_id, value in Product.objects.values_list('id', 'alergens_old').iterator():
+        rows.extend(ProductAlergen(product_id=product_id, alergen_id=i)
+                    for i in dict.fromkeys(parse_ids(value)) if i in alergen_ids)
+    ProductAlergen.objects.bulk_create(rows, batch_size=1000)
+
+    rows = []
+    for dish_id, value in Dish.objects.values_list('id', 'products_old').iterator():
+        rows.extend(DishProduct(dish_id=dish_id, product_id=i)
+                    for i in dict.fromkeys(parse_ids(value)) if i in product_ids)
+    DishProduct.objects.bulk_create(rows, batch_size=1000)
+
+    rows = []
+    for menu_id, breakfast, lunch in Menu.objects.values_list('id', 'breakfast_old', 'lunch_old').iterator():
+        for meal_type, value in (('breakfast', breakfast), ('lunch', lunch)):
+            rows.extend(MenuDish(menu_id=menu_id, dish_id=i, meal_type=meal_type)
+                        for i in dict.fromkeys(parse_ids(value)) if i in dish_ids)
+    MenuDish.objects.bulk_create(rows, batch_size=1000)
+
+    rows = []
+    values = Applications.objects.values_list('id', 'list_of_products_old', 'amount_of_products_old')
+    for application_id, products, amounts in values.iterator():
+        amounts = parse_ids(amounts)
+        seen = set()
+        for i, product_id in enumerate(parse_ids(products)):
+            if product_id in product_ids and product_id not in seen:
+                seen.add(product_id)
+                rows.append(ApplicationItem(application_id=application_id, product_id=product_id,
+                                            amount=amounts[i] if i < len(amounts) else 0))
+    ApplicationItem.objects.bulk_create(rows, batch_size=1000)
+
+
+def backwards(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    Product = apps.get_model('core', 'Product')
+    Dish = apps.get_model('core', 'Dish')
+    DishProduct = apps.get_model('core', 'DishProduct')
+    Menu = apps.get_model('core', 'Menu')
+    MenuDish = apps.get_model('core', 'MenuDish')
+    Applications = apps.get_model('core', 'Applications')
+    ApplicationItem = apps.get_model('core', 'ApplicationItem')
+
+    def collect(rows):
+        result = {}
+        for key, value in rows:
+            result.setdefault(key, []).append(str(value))
+        return result
+
+    users = collect(User.alergens.through.objects.order_by('id').values_list('user_id', 'alergen_id'))
+    User.objects.bulk_update([User(id=k, alergens_old=','.join(v)) for k, v in users.items()],
+                             ['alergens_old'], batch_size=500)
+    products = collect(Product.alergens.through.objects.order_by('id').values_list('product_id', 'alergen_id'))
+    Product.objects.bulk_update([Product(id=k, alergens_old=','.join(v)) for k, v in products.items()],
+                                ['alergens_old'], batch_size=500)
+    dishes = collect(DishProduct.objects.order_by('id').values_list('dish_id', 'product_id'))
+    Dish.objects.bulk_update([Dish(id=k, products_old=','.join(v)) for k, v in dishes.items()],
+                             ['products_old'], batch_size=500)
+
+    menus = {}
+    for menu_id, meal_type, dish_id in MenuDish.objects.order_by('id').values_list('menu_id', 'meal_type', 'dish_id'):
+        menus.setdefault(menu_id, {'breakfast': [], 'lunch': []})[meal_type].append(str(dish_id))
+    Menu.objects.bulk_update(
+        [Menu(id=k, breakfast_old=','.join(v['breakfast']), lunch_old=','.join(v['lunch'])) for k, v in menus.items()],
+        ['breakfast_old', 'lunch_old'], batch_size=500
+    )
+
+    applications = {}
+    for application_id, product_id, amount in ApplicationItem.objects.order_by('id').values_list(
+            'application_id', 'product_id', 'amount'):
+        item = applications.setdefault(application_id, ([], []))
+        item[0].append(str(product_id))
+        item[1].append(str(amount))
+    Applications.objects.bulk_update(
+        [Applications(id=k, list_of_products_old=','.join(p), amount_of_products_old=','.join(a))
+         for k, (p, a) in applications.items()],
+        ['list_of_products_old', 'amount_of_products_old'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_dish_alergens_mask'),
+    ]
+
+    operations = [
+        migrations.RenameField(model_name='user', old_name='alergens', new_name='alergens_old'),
+        migrations.RenameField(model_name='product', old_name='alergens', new_name='alergens_old'),
+        migrations.RenameField(model_name='dish', old_name='products', new_name='products_old'),
+        migrations.RenameField(model_name='menu', old_name='breakfast', new_name='breakfast_old'),
+        migrations.RenameField(model_name='menu', old_name='lunch', new_name='lunch_old'),
+        migrations.RenameField(model_name='applications', old_name='list_of_products', new_name='list_of_products_old'),
+        migrations.RenameField(model_name='applications', old_name='amount_of_products', new_name='amount_of_products_old'),
+        migrations.AlterField(
+            model_name='applications',
+            name='list_of_products_old',
+            field=models.TextField(blank=True, default='', verbose_name='Список продуктов'),
+        ),
+        migrations.AlterField(
+            model_name='applications',
+            name='amount_of_products_old',
+            field=models.TextField(blank=True, default='', verbose_name='Количество продуктов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='alergens_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска аллергенов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='alergens',
+            field=models.ManyToManyField(blank=True, related_name='users', to='core.alergen', verbose_name='Аллергены'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='alergens',
+            field=models.ManyToManyField(blank=True, related_name='products', to='core.alergen', verbose_name='Аллергены'),
+        ),
+        migrations.CreateModel(
+            name='DishProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.dish', verbose_name='Блюдо')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.product', verbose_name='Продукт')),
+            ],
+            options={
+                'verbose_name': 'Продукт блюда',
+                'verbose_name_plural': 'Продукты блюда',
+                'unique_together': {('dish', 'product')},
+            },
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='products',
+            field=models.ManyToManyField(blank=True, related_name='dishes', through='core.DishProduct', to='core.product', verbose_name='Продукты'),
+        ),
+        migrations.CreateModel(
+            name='MenuDish',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('meal_type', models.CharField(choices=[('breakfast', 'Завтрак'), ('lunch', 'Обед')], max_length=20, verbose_name='Тип приема пищи')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='menu_dishes', to='core.dish', verbose_name='Блюдо')),
+                ('menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='menu_dishes', to='core.menu', verbose_name='Меню')),
+            ],
+            options={
+                'verbose_name': 'Блюдо в меню',
+                'verbose_name_plural': 'Блюда в меню',
+                'ordering': ['id'],
+                'unique_together': {('menu', 'meal_type', 'dish')},
+            },
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='dishes',
+            field=models.ManyToManyField(blank=True, related_name='menus', through='core.MenuDish', to='core.dish', verbose_name='Блюда'),
+        ),
+        migrations.CreateModel(
+            name='ApplicationItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(default=0, verbose_name='Количество')),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='core.applications', verbose_name='Заявка')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.product', verbose_name='Продукт')),
+            ],
+            options={
+                'verbose_name': 'Позиция заявки',
+                'verbose_name_plural': 'Позиции заявки',
+                'ordering': ['id'],
+                'unique_together': {('application', 'product')},
+            },
+        ),
+        migrations.AddField(
+            model_name='applications',
+            name='products',
+            field=models.ManyToManyField(related_name='applications', through='core.ApplicationItem', to='core.product', verbose_name='Продукты'),
+        ),
+        migrations.RunPython(forwards, backwards),
+        migrations.RemoveField(model_name='user', name='alergens_old'),
+        migrations.RemoveField(model_name='product', name='alergens_old'),
+        migrations.RemoveField(model_name='dish', name='products_old'),
+        migrations.RemoveField(model_name='menu', name='breakfast_old'),
+        migrations.RemoveField(model_name='menu', name='lunch_old'),
+        migrations.RemoveField(model_name='applications', name='list_of_products_old'),
+        migrations.RemoveField(model_name='applications', name='amount_of_products_old'),
+    ]
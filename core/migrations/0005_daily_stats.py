@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_relational_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Дата')),
+                ('payments_total', models.IntegerField(default=0, verbose_name='Сумма пополнений')),
+                ('payments_count', models.IntegerField(default=0, verbose_name='Количество пополнений')),
+                ('breakfasts', models.IntegerField(default=0, verbose_name='Выдано завтраков')),
+                ('lunches', models.IntegerField(default=0, verbose_name='Выдано обедов')),
+                ('breakfast_revenue', models.IntegerField(default=0, verbose_name='Выручка за завтраки')),
+                ('lunch_revenue', models.IntegerField(default=0, verbose_name='Выручка за обеды')),
+                ('purchases_total', models.IntegerField(default=0, verbose_name='Расходы на закупки')),
+            ],
+            options={
+                'verbose_name': 'Статистика за день',
+                'verbose_name_plural': 'Статистика по дням',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='price',
+            field=models.IntegerField(default=0, verbose_name='Списано'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='applications',
+            index=models.Index(fields=['-date', '-id'], name='application_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['name', 'id'], name='dish_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'name', 'id'], name='user_role_name_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations
+
+
+def normalize(text):
+    return text.casefold().replace('ё', 'е')
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS core_search "
+            "USING fts5(kind UNINDEXED, object_id UNINDEXED, content, tokenize='unicode61')"
+        )
+        # Первичное наполнение; дальше индекс поддерживается сигналами
+        rows = []
+        for kind, model, fields in (('user', 'User', ('login', 'name', 'email')),
+                                    ('dish', 'Dish', ('name',)),
+                                    ('product', 'Product', ('name',))):
+            for values in apps.get_model('core', model).objects.values_list('id', *fields).iterator():
+                rows.append((kind, values[0], normalize(' '.join(str(v or '') for v in values[1:]))))
+        with connection.cursor() as cursor:
+            cursor.executemany('INSERT INTO core_search (kind, object_id, content) VALUES (%s, %s, %s)', rows)
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, column in (('core_user', 'login'), ('core_user', 'name'), ('core_user', 'email'),
+                              ('core_dish', 'name'), ('core_product', 'name')):
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm '
+                f'ON {table} USING gin (UPPER({column}) gin_trgm_ops)'
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS core_search')
+    elif connection.vendor == 'postgresql':
+        for table, column in (('core_user', 'login'), ('core_user', 'name'), ('core_user', 'email'),
+                              ('core_dish', 'name'), ('core_product', 'name')):
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='applications',
+            index=models.Index(fields=['status', '-date', '-id'], name='application_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='applications',
+            index=models.Index(fields=['user', '-date', '-id'], name='application_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['date', 'succesful'], name='payment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', '-date'], name='payment_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('amount__lt', 10)), fields=['amount'], name='product_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'end_date'], name='subscription_user_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['end_date'], name='subscription_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['register_date', 'id'], name='subscription_register_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def open_balances(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    BalanceEntry = apps.get_model('core', 'BalanceEntry')
+    # Текущий баланс переносится в журнал одной корректировкой на пользователя
+    entries = [
+        BalanceEntry(user_id=user_id, kind='adjustment', amount=balance, reference='opening')
+        for user_id, balance in User.objects.exclude(balance=0).values_list('id', 'balance').iterator()
+    ]
+    BalanceEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_id', models.BigIntegerField(verbose_name='Последняя операция')),
+                ('balance', models.IntegerField(verbose_name='Баланс')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Снимок баланса',
+                'verbose_name_plural': 'Снимки баланса',
+                'ordering': ['-entry_id'],
+                'indexes': [models.Index(fields=['user', '-entry_id'], name='balance_snapshot_user_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('topup', 'Пополнение'), ('meal', 'Питание'), ('subscription', 'Абонемент'), ('refund', 'Возврат'), ('adjustment', 'Корректировка')], max_length=20, verbose_name='Операция')),
+                ('amount', models.IntegerField(verbose_name='Сумма')),
+                ('reference', models.CharField(blank=True, default='', max_length=100, verbose_name='Основание')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Операция по балансу',
+                'verbose_name_plural': 'Журнал баланса',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['user', 'id'], name='balance_entry_user_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
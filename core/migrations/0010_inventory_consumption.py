@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:29
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_history_consumed(apps, schema_editor):
+    # Прошлые выдачи уже отражены в ручных остатках склада, списываем только новые
+    Menu = apps.get_model('core', 'Menu')
+    Menu.objects.update(consumed_breakfasts_amount=F('given_breakfasts_amount'),
+                        consumed_lunches_amount=F('given_lunches_amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_balance_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dishproduct',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1, verbose_name='Расход на порцию'),
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='consumed_breakfasts_amount',
+            field=models.IntegerField(default=0, verbose_name='Списано завтраков'),
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='consumed_lunches_amount',
+            field=models.IntegerField(default=0, verbose_name='Списано обедов'),
+        ),
+        migrations.RunPython(mark_history_consumed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:38
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_ratings(apps, schema_editor):
+    Dish = apps.get_model('core', 'Dish')
+    Reviews = apps.get_model('core', 'Reviews')
+    rows = Reviews.objects.order_by().values('dish_id').annotate(
+        count=Count('id'), total=Sum('review'),
+        **{f'r{value}': Count('id', filter=Q(review=value)) for value in range(1, 6)},
+    )
+    dishes = []
+    for row in rows:
+        dish = Dish(id=row['dish_id'], rating_count=row['count'], rating_sum=row['total'],
+                    rating_avg=row['total'] / row['count'])
+        for value in range(1, 6):
+            setattr(dish, f'rating_{value}', row[f'r{value}'])
+        dishes.append(dish)
+    Dish.objects.bulk_update(dishes, ['rating_count', 'rating_sum', 'rating_avg'] +
+                             [f'rating_{value}' for value in range(1, 6)], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_inventory_consumption'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='rating_1',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Оценок «1»'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_2',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Оценок «2»'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_3',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Оценок «3»'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_4',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Оценок «4»'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_5',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Оценок «5»'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Число оценок'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['-rating_avg', '-rating_count'], name='dish_rating_idx'),
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
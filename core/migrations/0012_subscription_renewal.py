@@ -0,0 +1,84 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Q, When
+import django.db.models.deletion
+import django.utils.timezone
+
+
+TARIFFS = {
+    (7, 'breakfast'): 700, (7, 'lunch'): 1000, (7, 'both'): 1500,
+    (14, 'breakfast'): 1300, (14, 'lunch'): 1900, (14, 'both'): 2800,
+    (30, 'breakfast'): 2500, (30, 'lunch'): 3800, (30, 'both'): 5500,
+}
+
+
+def fill_subscriptions(apps, schema_editor):
+    Subscription = apps.get_model('core', 'Subscription')
+    Subscription.objects.update(price=Case(
+        *[When(Q(duration=duration, meal_type=meal_type), then=price) for (duration, meal_type), price in TARIFFS.items()],
+        default=0,
+    ))
+    # Уже закончившиеся абонементы помечаем сразу, без уведомлений о давно истекших
+    today = django.utils.timezone.now().date()
+    Subscription.objects.filter(end_date__lt=today).update(status='expired')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_dish_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('low_balance', 'Недостаточно средств для продления'), ('renewed', 'Абонемент продлен'), ('expired', 'Абонемент истек')], max_length=20, verbose_name='Тип')),
+                ('message', models.TextField(verbose_name='Сообщение')),
+                ('reference', models.CharField(max_length=100, verbose_name='Основание')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('read_at', models.DateTimeField(blank=True, null=True, verbose_name='Прочитано')),
+            ],
+            options={
+                'verbose_name': 'Уведомление',
+                'verbose_name_plural': 'Уведомления',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='auto_renew',
+            field=models.BooleanField(default=False, verbose_name='Автопродление'),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='price',
+            field=models.IntegerField(default=0, verbose_name='Стоимость'),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='status',
+            field=models.CharField(choices=[('active', 'Действует'), ('renewed', 'Продлен'), ('expired', 'Истек')], default='active', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['status', 'end_date'], name='subscription_status_end_idx'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'read_at'], name='notification_user_unread_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('user', 'kind', 'reference'), name='notification_unique'),
+        ),
+        migrations.RunPython(fill_subscriptions, migrations.RunPython.noop),
+    ]
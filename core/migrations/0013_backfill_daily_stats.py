@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def backfill_daily_stats(apps, schema_editor):
+    # То же, что rebuild_daily_stats, но только для дней без строки: уже пересчитанные базы не трогаем.
+    # Выручка до 0005 остается нулевой: Attendance.price у старых посещений равен 0
+    DailyStats = apps.get_model('core', 'DailyStats')
+    Payment = apps.get_model('core', 'Payment')
+    Attendance = apps.get_model('core', 'Attendance')
+    Applications = apps.get_model('core', 'Applications')
+    existing = set(DailyStats.objects.values_list('date', flat=True))
+    rows = {}
+
+    def row(date):
+        return rows.setdefault(date, DailyStats(date=date))
+
+    for item in Payment.objects.filter(succesful=True).order_by().values('date').annotate(
+            total=Sum('amount'), count=Count('id')):
+        stats = row(item['date'])
+        stats.payments_total = item['total'] or 0
+        stats.payments_count = item['count']
+
+    for item in Attendance.objects.order_by().values('date', 'meal_type').annotate(
+            count=Count('id'), revenue=Sum('price')):
+        stats = row(item['date'])
+        if item['meal_type'] == 'breakfast':
+            stats.breakfasts = item['count']
+            stats.breakfast_revenue = item['revenue'] or 0
+        else:
+            stats.lunches = item['count']
+            stats.lunch_revenue = item['revenue'] or 0
+
+    for item in Applications.objects.filter(status='approved').order_by().values('date').annotate(
+            total=Sum('price')):
+        row(item['date']).purchases_total = item['total'] or 0
+
+    DailyStats.objects.bulk_create([stats for date, stats in rows.items() if date not in existing], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_subscription_renewal'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
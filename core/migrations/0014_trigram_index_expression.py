@@ -0,0 +1,34 @@
+from django.db import migrations
+
+TRIGRAM_COLUMNS = (('core_user', 'login'), ('core_user', 'name'), ('core_user', 'email'),
+                   ('core_dish', 'name'), ('core_product', 'name'))
+
+
+def recreate(schema_editor, expression):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in TRIGRAM_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+        schema_editor.execute(
+            f'CREATE INDEX {table}_{column}_trgm ON {table} USING gin ({expression.format(column=column)} gin_trgm_ops)'
+        )
+
+
+def match_icontains(apps, schema_editor):
+    # icontains в Django на PostgreSQL — UPPER("col"::text) LIKE UPPER(%s); индекс строится на том же выражении
+    recreate(schema_editor, 'UPPER(({column})::text)')
+
+
+def restore_previous(apps, schema_editor):
+    recreate(schema_editor, 'UPPER({column})')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_backfill_daily_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(match_icontains, restore_previous),
+    ]
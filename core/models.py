@@ -1,7 +1,21 @@
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
 
+ALERGEN_MASK_BITS = 63
+
+menu_dishes_set = Signal()
+
+
+def alergens_to_mask(alergen_ids):
+    # ID старше 63 складываются по модулю: лишнее предупреждение лучше пропущенного аллергена
+    mask = 0
+    for alergen_id in alergen_ids:
+        mask |= 1 << ((alergen_id - 1) % ALERGEN_MASK_BITS)
+    return mask
+
+
 class UserManager(BaseUserManager):
     def create_user(self, login, email, password=None, **extra_fields):
         if not login:
@@ -34,7 +48,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     login = models.CharField('Логин', max_length=100, unique=True)
     birth_date = models.DateField('Дата рождения', null=True, blank=True)
     role = models.CharField('Роль', max_length=20, choices=ROLE_CHOICES, default='student')
-    alergens = models.TextField('Аллергены', blank=True, default='')
+    alergens = models.ManyToManyField('Alergen', verbose_name='Аллергены', blank=True, related_name='users')
+    alergens_mask = models.BigIntegerField('Маска аллергенов', default=0, editable=False)
     balance = models.IntegerField('Баланс', default=0)
     
     is_active = models.BooleanField('Активен', default=True)
@@ -48,14 +63,20 @@ class User(AbstractBaseUser, PermissionsMixin):
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = [models.Index(fields=['role', 'name', 'id'], name='user_role_name_idx')]
     
     def __str__(self):
         return f"{self.name} ({self.login})"
     
     def get_alergens_list(self):
-        if not self.alergens:
-            return []
-        return [int(x.strip()) for x in self.alergens.split(',') if x.strip().isdigit()]
+        return [a.id for a in self.alergens.all()]
+    
+    def get_alergens_mask(self):
+        return self.alergens_mask
+    
+    def refresh_alergens_mask(self):
+        self.alergens_mask = alergens_to_mask(self.alergens.values_list('id', flat=True))
+        User.objects.filter(pk=self.pk).update(alergens_mask=self.alergens_mask)
 
 
 class Alergen(models.Model):
@@ -71,57 +92,115 @@ class Alergen(models.Model):
 
 class Product(models.Model):
     name = models.CharField('Название', max_length=200)
-    alergens = models.TextField('Аллергены', blank=True, default='')
+    alergens = models.ManyToManyField(Alergen, verbose_name='Аллергены', blank=True, related_name='products')
     amount = models.IntegerField('Количество', default=0)
     
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+            # Частичный индекс: на складе мало позиций с малым остатком
+            models.Index(fields=['amount'], condition=models.Q(amount__lt=10), name='product_low_stock_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.amount} шт.)"
     
     def get_alergens_list(self):
-        if not self.alergens:
-            return []
-        return [int(x.strip()) for x in self.alergens.split(',') if x.strip().isdigit()]
+        return [a.id for a in self.alergens.all()]
+    
+    def get_menus(self):
+        return Menu.objects.filter(menu_dishes__dish__products=self).distinct()
 
 
 class Dish(models.Model):
     name = models.CharField('Название', max_length=200)
-    products = models.TextField('Продукты', blank=True, default='')
+    products = models.ManyToManyField(Product, through='DishProduct', verbose_name='Продукты',
+                                      blank=True, related_name='dishes')
     amount = models.IntegerField('Количество порций', default=0)
     price = models.IntegerField('Цена', default=0)
+    alergens_mask = models.BigIntegerField('Маска аллергенов', default=0, editable=False)
+    # Агрегаты отзывов ведутся сигналами Reviews; пересчет с нуля — recompute_dish_ratings
+    rating_count = models.IntegerField('Число оценок', default=0, editable=False)
+    rating_sum = models.IntegerField('Сумма оценок', default=0, editable=False)
+    rating_1 = models.IntegerField('Оценок «1»', default=0, editable=False)
+    rating_2 = models.IntegerField('Оценок «2»', default=0, editable=False)
+    rating_3 = models.IntegerField('Оценок «3»', default=0, editable=False)
+    rating_4 = models.IntegerField('Оценок «4»', default=0, editable=False)
+    rating_5 = models.IntegerField('Оценок «5»', default=0, editable=False)
+    rating_avg = models.FloatField('Средняя оценка', default=0, editable=False)
+    
+    RATING_FIELDS = ('rating_count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+                     'rating_avg')
     
     class Meta:
         verbose_name = 'Блюдо'
         verbose_name_plural = 'Блюда'
+        indexes = [
+            models.Index(fields=['name', 'id'], name='dish_name_idx'),
+            models.Index(fields=['-rating_avg', '-rating_count'], name='dish_rating_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        # Форма блюда не должна затирать счетчики оценок, измененные после ее загрузки
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                       if not f.primary_key and f.name not in self.RATING_FIELDS]
+        super().save(*args, **kwargs)
+    
+    def rating_histogram(self):
+        return [(value, getattr(self, f'rating_{value}')) for value in range(5, 0, -1)]
+    
+    @classmethod
+    def refresh_alergens_masks(cls, dish_ids):
+        dish_ids = set(dish_ids)
+        if not dish_ids:
+            return
+        masks = dict.fromkeys(dish_ids, 0)
+        rows = DishProduct.objects.filter(
+            dish_id__in=dish_ids, product__alergens__isnull=False
+        ).values_list('dish_id', 'product__alergens')
+        for dish_id, alergen_id in rows:
+            masks[dish_id] |= alergens_to_mask([alergen_id])
+        cls.objects.bulk_update(
+            [cls(id=dish_id, alergens_mask=mask) for dish_id, mask in masks.items()],
+            ['alergens_mask']
+        )
+    
     def get_products_list(self):
-        if not self.products:
-            return []
-        return [int(x.strip()) for x in self.products.split(',') if x.strip().isdigit()]
+        return [p.id for p in self.products.all()]
     
     def get_alergens(self):
-        alergens = set()
-        for product_id in self.get_products_list():
-            try:
-                product = Product.objects.get(id=product_id)
-                alergens.update(product.get_alergens_list())
-            except Product.DoesNotExist:
-                pass
-        return list(alergens)
+        return list(Alergen.objects.filter(products__dishes=self).values_list('id', flat=True).distinct())
+
+
+class DishProduct(models.Model):
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, verbose_name='Блюдо')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Продукт')
+    quantity = models.PositiveIntegerField('Расход на порцию', default=1)
+    
+    class Meta:
+        verbose_name = 'Продукт блюда'
+        verbose_name_plural = 'Продукты блюда'
+        unique_together = ['dish', 'product']
+    
+    def __str__(self):
+        return f"{self.dish.name}: {self.product.name}"
 
 
 class Menu(models.Model):
     date = models.DateField('Дата', unique=True)
-    breakfast = models.TextField('Завтрак', blank=True, default='')
-    lunch = models.TextField('Обед', blank=True, default='')
+    dishes = models.ManyToManyField(Dish, through='MenuDish', verbose_name='Блюда',
+                                    blank=True, related_name='menus')
     given_breakfasts_amount = models.IntegerField('Выдано завтраков', default=0)
     given_lunches_amount = models.IntegerField('Выдано обедов', default=0)
+    # Сколько выданных порций уже списано со склада продуктов
+    consumed_breakfasts_amount = models.IntegerField('Списано завтраков', default=0)
+    consumed_lunches_amount = models.IntegerField('Списано обедов', default=0)
     
     class Meta:
         verbose_name = 'Меню'
@@ -131,17 +210,41 @@ class Menu(models.Model):
     def __str__(self):
         return f"Меню на {self.date}"
     
+    def get_dishes(self, meal_type):
+        if 'menu_dishes' in getattr(self, '_prefetched_objects_cache', {}):
+            return [item.dish for item in self.menu_dishes.all() if item.meal_type == meal_type]
+        return [item.dish for item in self.menu_dishes.filter(meal_type=meal_type).select_related('dish')]
+    
     def get_breakfast_dishes(self):
-        if not self.breakfast:
-            return []
-        ids = [int(x.strip()) for x in self.breakfast.split(',') if x.strip().isdigit()]
-        return Dish.objects.filter(id__in=ids)
+        return self.get_dishes('breakfast')
     
     def get_lunch_dishes(self):
-        if not self.lunch:
-            return []
-        ids = [int(x.strip()) for x in self.lunch.split(',') if x.strip().isdigit()]
-        return Dish.objects.filter(id__in=ids)
+        return self.get_dishes('lunch')
+    
+    def set_dishes(self, meal_type, dishes):
+        self.menu_dishes.filter(meal_type=meal_type).delete()
+        MenuDish.objects.bulk_create([MenuDish(menu=self, dish=dish, meal_type=meal_type) for dish in dishes])
+        menu_dishes_set.send(sender=Menu, instance=self, meal_type=meal_type)
+
+
+class MenuDish(models.Model):
+    MEAL_CHOICES = [
+        ('breakfast', 'Завтрак'),
+        ('lunch', 'Обед'),
+    ]
+    
+    menu = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name='menu_dishes', verbose_name='Меню')
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='menu_dishes', verbose_name='Блюдо')
+    meal_type = models.CharField('Тип приема пищи', max_length=20, choices=MEAL_CHOICES)
+    
+    class Meta:
+        verbose_name = 'Блюдо в меню'
+        verbose_name_plural = 'Блюда в меню'
+        unique_together = ['menu', 'meal_type', 'dish']
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.menu.date} {self.get_meal_type_display()}: {self.dish.name}"
 
 
 class Attendance(models.Model):
@@ -153,6 +256,7 @@ class Attendance(models.Model):
     date = models.DateField('Дата')
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь')
     meal_type = models.CharField('Тип приема пищи', max_length=20, choices=MEAL_CHOICES, default='lunch')
+    price = models.IntegerField('Списано', default=0)
     
     class Meta:
         verbose_name = 'Посещение'
@@ -173,27 +277,54 @@ class Payment(models.Model):
         verbose_name = 'Платеж'
         verbose_name_plural = 'Платежи'
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date', 'succesful'], name='payment_date_idx'),
+            models.Index(fields=['user', '-date'], name='payment_user_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.name} - {self.amount} руб. ({self.date})"
 
 
+class SubscriptionQuerySet(models.QuerySet):
+    def active(self, date=None):
+        from django.utils import timezone
+        # Продленный абонемент перекрыт своим продолжением, истекший ждет только уборки
+        return self.filter(status='active', end_date__gte=date or timezone.now().date())
+
+
 class Subscription(models.Model):
     MEAL_CHOICES = [
         ('breakfast', 'Завтрак'),
         ('lunch', 'Обед'),
         ('both', 'Завтрак и обед'),
     ]
+    STATUS_CHOICES = [
+        ('active', 'Действует'),
+        ('renewed', 'Продлен'),
+        ('expired', 'Истек'),
+    ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь')
     duration = models.IntegerField('Длительность (дней)')
     register_date = models.DateField('Дата оформления', auto_now_add=True)
     end_date = models.DateField('Дата окончания')
     meal_type = models.CharField('Тип питания', max_length=20, choices=MEAL_CHOICES, default='both')
+    price = models.IntegerField('Стоимость', default=0)
+    status = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='active')
+    auto_renew = models.BooleanField('Автопродление', default=False)
+    
+    objects = SubscriptionQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Абонемент'
         verbose_name_plural = 'Абонементы'
+        indexes = [
+            models.Index(fields=['user', 'end_date'], name='subscription_user_end_idx'),
+            models.Index(fields=['end_date'], name='subscription_end_idx'),
+            models.Index(fields=['register_date', 'id'], name='subscription_register_idx'),
+            models.Index(fields=['status', 'end_date'], name='subscription_status_end_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.name} - до {self.end_date}"
@@ -204,6 +335,13 @@ class Subscription(models.Model):
         return self.end_date >= timezone.now().date()
 
 
+class ApplicationsQuerySet(models.QuerySet):
+    def with_products(self):
+        return self.select_related('user').prefetch_related(
+            models.Prefetch('items', queryset=ApplicationItem.objects.select_related('product'))
+        )
+
+
 class Applications(models.Model):
     STATUS_CHOICES = [
         ('pending', 'На рассмотрении'),
@@ -213,32 +351,78 @@ class Applications(models.Model):
     
     date = models.DateField('Дата', auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Создал')
-    list_of_products = models.TextField('Список продуктов')
-    amount_of_products = models.TextField('Количество продуктов')
+    products = models.ManyToManyField(Product, through='ApplicationItem', verbose_name='Продукты',
+                                      related_name='applications')
     price = models.IntegerField('Общая стоимость', default=0)
     status = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='pending')
     
+    objects = ApplicationsQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Заявка на закупку'
         verbose_name_plural = 'Заявки на закупку'
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['-date', '-id'], name='application_date_idx'),
+            models.Index(fields=['status', '-date', '-id'], name='application_status_date_idx'),
+            models.Index(fields=['user', '-date', '-id'], name='application_user_date_idx'),
+        ]
     
     def __str__(self):
         return f"Заявка #{self.id} от {self.date}"
     
     def get_products_with_amounts(self):
-        products_ids = [int(x.strip()) for x in self.list_of_products.split(',') if x.strip().isdigit()]
-        amounts = [int(x.strip()) for x in self.amount_of_products.split(',') if x.strip().isdigit()]
-        
-        result = []
-        for i, product_id in enumerate(products_ids):
-            try:
-                product = Product.objects.get(id=product_id)
-                amount = amounts[i] if i < len(amounts) else 0
-                result.append((product, amount))
-            except Product.DoesNotExist:
-                pass
-        return result
+        return [(item.product, item.amount) for item in self.items.all()]
+    
+    def approve(self):
+        # Статус меняется условным UPDATE: повторное одобрение не добавит продукты дважды
+        with transaction.atomic():
+            if not Applications.objects.filter(id=self.id, status='pending').update(status='approved'):
+                return False
+            amounts = dict(self.items.values_list('product_id', 'amount'))
+            if amounts:
+                Product.objects.filter(id__in=amounts).update(amount=models.Case(
+                    *[models.When(id=product_id, then=models.F('amount') + amount)
+                      for product_id, amount in amounts.items()],
+                    default=models.F('amount'),
+                ))
+        self.status = 'approved'
+        return True
+
+
+class ApplicationItem(models.Model):
+    application = models.ForeignKey(Applications, on_delete=models.CASCADE, related_name='items',
+                                    verbose_name='Заявка')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Продукт')
+    amount = models.IntegerField('Количество', default=0)
+    
+    class Meta:
+        verbose_name = 'Позиция заявки'
+        verbose_name_plural = 'Позиции заявки'
+        unique_together = ['application', 'product']
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.product.name}: {self.amount}"
+
+
+class DailyStats(models.Model):
+    date = models.DateField('Дата', unique=True)
+    payments_total = models.IntegerField('Сумма пополнений', default=0)
+    payments_count = models.IntegerField('Количество пополнений', default=0)
+    breakfasts = models.IntegerField('Выдано завтраков', default=0)
+    lunches = models.IntegerField('Выдано обедов', default=0)
+    breakfast_revenue = models.IntegerField('Выручка за завтраки', default=0)
+    lunch_revenue = models.IntegerField('Выручка за обеды', default=0)
+    purchases_total = models.IntegerField('Расходы на закупки', default=0)
+    
+    class Meta:
+        verbose_name = 'Статистика за день'
+        verbose_name_plural = 'Статистика по дням'
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"Статистика за {self.date}"
 
 
 class Reviews(models.Model):
@@ -255,3 +439,75 @@ class Reviews(models.Model):
     
     def __str__(self):
         return f"{self.user.name} - {self.dish.name}: {self.review}/5"
+
+
+class BalanceEntry(models.Model):
+    KIND_CHOICES = [
+        ('topup', 'Пополнение'),
+        ('meal', 'Питание'),
+        ('subscription', 'Абонемент'),
+        ('refund', 'Возврат'),
+        ('adjustment', 'Корректировка'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_entries',
+                             verbose_name='Пользователь')
+    kind = models.CharField('Операция', max_length=20, choices=KIND_CHOICES)
+    amount = models.IntegerField('Сумма')
+    reference = models.CharField('Основание', max_length=100, blank=True, default='')
+    created_at = models.DateTimeField('Время', auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Операция по балансу'
+        verbose_name_plural = 'Журнал баланса'
+        ordering = ['-id']
+        indexes = [models.Index(fields=['user', 'id'], name='balance_entry_user_idx')]
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.amount:+} ({self.get_kind_display()})"
+
+
+class BalanceSnapshot(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_snapshots',
+                             verbose_name='Пользователь')
+    entry_id = models.BigIntegerField('Последняя операция')
+    balance = models.IntegerField('Баланс')
+    created_at = models.DateTimeField('Время', auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Снимок баланса'
+        verbose_name_plural = 'Снимки баланса'
+        ordering = ['-entry_id']
+        indexes = [models.Index(fields=['user', '-entry_id'], name='balance_snapshot_user_idx')]
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.balance} на операции #{self.entry_id}"
+
+
+class Notification(models.Model):
+    KIND_CHOICES = [
+        ('low_balance', 'Недостаточно средств для продления'),
+        ('renewed', 'Абонемент продлен'),
+        ('expired', 'Абонемент истек'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications',
+                             verbose_name='Пользователь')
+    kind = models.CharField('Тип', max_length=20, choices=KIND_CHOICES)
+    message = models.TextField('Сообщение')
+    # Повторный запуск планировщика не создает дубликатов: (user, kind, reference) уникальны
+    reference = models.CharField('Основание', max_length=100)
+    created_at = models.DateTimeField('Создано', auto_now_add=True)
+    read_at = models.DateTimeField('Прочитано', null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'reference'], name='notification_unique'),
+        ]
+        indexes = [models.Index(fields=['user', 'read_at'], name='notification_user_unread_idx')]
+    
+    def __str__(self):
+        return f"{self.user}: {self.get_kind_display()}"
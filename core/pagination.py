@@ -0,0 +1,140 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+def encode_cursor(direction, values):
+    data = json.dumps([direction, values], default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(data)
+    except (ValueError, TypeError):
+        return None, None
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        return None, None
+    return direction, values
+
+
+def clean_cursor(model, ordering, values):
+    # Курсор приходит от клиента: приводим значения к типам полей, при ошибке — первая страница
+    cleaned = []
+    try:
+        for field, value in zip(ordering, values):
+            if value is None:
+                return None
+            opts = model._meta
+            parts = field.lstrip('-').split('__')
+            for part in parts[:-1]:
+                opts = opts.get_field(part).related_model._meta
+            cleaned.append(opts.get_field(parts[-1]).to_python(value))
+    except (FieldDoesNotExist, ValidationError, ValueError, TypeError):
+        return None
+    return cleaned
+
+
+def seek_filter(ordering, values, forward):
+    # (a, b, id) > (x, y, z) раскрывается в a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, items, has_next, has_prev, ordering, params, per_page):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.ordering = ordering
+        self.params = params
+        self.per_page = per_page
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def key(self, obj):
+        values = []
+        for field in self.ordering:
+            value = obj
+            for part in field.lstrip('-').split('__'):
+                value = getattr(value, part)
+            values.append(value)
+        return values
+
+    def url(self, direction, obj):
+        params = self.params.copy()
+        params['cursor'] = encode_cursor(direction, self.key(obj))
+        return '?' + params.urlencode()
+
+    @property
+    def next_url(self):
+        return self.url('next', self.items[-1]) if self.has_next else None
+
+    @property
+    def prev_url(self):
+        return self.url('prev', self.items[0]) if self.has_prev else None
+
+    @property
+    def first_url(self):
+        params = self.params.copy()
+        params.pop('cursor', None)
+        return '?' + params.urlencode()
+
+
+def keyset_paginate(request, queryset, ordering, per_page=DEFAULT_PER_PAGE):
+    # ordering должен заканчиваться уникальным полем (обычно id), иначе страницы могут терять строки
+    try:
+        per_page = int(request.GET.get('per_page', per_page))
+    except ValueError:
+        pass
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+
+    direction, values = decode_cursor(request.GET.get('cursor', ''))
+    if values is not None and len(values) != len(ordering):
+        direction = values = None
+    if values is not None:
+        values = clean_cursor(queryset.model, ordering, values)
+        if values is None:
+            direction = None
+
+    if direction == 'prev':
+        reverse = [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+        queryset = queryset.filter(seek_filter(ordering, values, forward=False)).order_by(*reverse)
+    else:
+        queryset = queryset.order_by(*ordering)
+        if direction == 'next':
+            queryset = queryset.filter(seek_filter(ordering, values, forward=True))
+
+    items = list(queryset[:per_page + 1])
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if direction == 'prev':
+        items.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, direction == 'next'
+
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    return KeysetPage(items, has_next, has_prev, ordering, params, per_page)
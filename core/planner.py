@@ -0,0 +1,142 @@
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count
+
+from .forecast import MEAL_TYPES, HISTORY_DAYS, weekday_means
+from .models import User, Dish, DishProduct, MenuDish, Product
+
+HISTOGRAM_KEY = 'planner:alergen-histogram'
+HISTOGRAM_TIMEOUT = 60 * 10
+# Сколько «средних» отзывов подмешивается к оценке блюда, чтобы одна пятерка не ставила его в лидеры
+PRIOR_REVIEWS = 5
+
+
+def alergen_histogram():
+    # Ученики сгруппированы по маске аллергенов: различных масок единицы-десятки, а не тысячи строк
+    histogram = cache.get(HISTOGRAM_KEY)
+    if histogram is None:
+        histogram = list(User.objects.filter(role='student', is_active=True).order_by()
+                         .values('alergens_mask').annotate(count=Count('id')).values_list('alergens_mask', 'count'))
+        cache.set(HISTOGRAM_KEY, histogram, HISTOGRAM_TIMEOUT)
+    masks = np.array([mask for mask, _ in histogram], dtype=np.int64)
+    counts = np.array([count for _, count in histogram], dtype=np.int64)
+    return masks, counts
+
+
+def invalidate_histogram():
+    cache.delete(HISTOGRAM_KEY)
+
+
+def covered_counts(dish_masks, masks, counts):
+    # Для каждой маски блюда (или набора) — число учеников без пересечения с ней
+    if not len(masks):
+        return np.zeros(len(dish_masks), dtype=np.int64)
+    return ((dish_masks[:, None] & masks[None, :]) == 0) @ counts
+
+
+def expected_ratings(sums, counts):
+    # Агрегаты оценок хранятся в самих блюдах (rating_sum, rating_count), таблицу отзывов не читаем
+    sums = np.asarray(sums, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    reviews = counts.sum()
+    prior = sums.sum() / reviews if reviews else 0
+    return (sums + prior * PRIOR_REVIEWS) / (counts + PRIOR_REVIEWS), counts
+
+
+def recipe_matrix(dish_ids):
+    # Расход продуктов на порцию: строки — блюда, столбцы — продукты; плюс текущий остаток склада
+    products = list(Product.objects.order_by('id').values_list('id', 'amount'))
+    product_ids = np.array([row[0] for row in products], dtype=np.int64)
+    stock = np.array([row[1] for row in products], dtype=np.float64)
+    matrix = np.zeros((len(dish_ids), len(products)))
+    rows = list(DishProduct.objects.filter(dish_id__in=dish_ids).values_list('dish_id', 'product_id', 'quantity'))
+    if rows:
+        dish_index = {dish_id: i for i, dish_id in enumerate(dish_ids)}
+        np.add.at(matrix, ([dish_index[row[0]] for row in rows], np.searchsorted(product_ids, [row[1] for row in rows])),
+                  [row[2] for row in rows])
+    return matrix, stock
+
+
+def meal_affinity(dish_ids):
+    # Подавалось ли блюдо раньше на этот прием пищи: суп не предлагаем на завтрак
+    dish_index = {dish_id: i for i, dish_id in enumerate(dish_ids)}
+    affinity = np.zeros((len(dish_ids), len(MEAL_TYPES)), dtype=bool)
+    for dish_id, meal_type in MenuDish.objects.order_by().values_list('dish_id', 'meal_type').distinct():
+        if dish_id in dish_index:
+            affinity[dish_index[dish_id], MEAL_TYPES.index(meal_type)] = True
+    return affinity
+
+
+def expected_portions(date, students):
+    means = weekday_means(date - timedelta(days=HISTORY_DAYS), date)[date.weekday()]
+    # Без истории считаем, что есть будут все ученики
+    return np.where(means > 0, means, students)
+
+
+def plan_menu(date, size=4):
+    dishes = list(Dish.objects.order_by('name', 'id').values_list('id', 'name', 'price', 'alergens_mask',
+                                                                  'rating_sum', 'rating_count'))
+    dish_ids = [row[0] for row in dishes]
+    dish_masks = np.array([row[3] for row in dishes], dtype=np.int64)
+    masks, counts = alergen_histogram()
+    students = int(counts.sum())
+
+    covered = covered_counts(dish_masks, masks, counts)
+    ratings, review_counts = expected_ratings([row[4] for row in dishes], [row[5] for row in dishes])
+    matrix, stock = recipe_matrix(dish_ids)
+    affinity = meal_affinity(dish_ids)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_product = np.where(matrix > 0, np.maximum(stock, 0)[None, :] // matrix, np.inf)
+    portions_in_stock = per_product.min(axis=1, initial=np.inf)
+    share = covered / students if students else np.ones(len(dishes))
+    portions = expected_portions(date, students)
+
+    proposal = {}
+    remaining = stock.copy()
+    for m, meal_type in enumerate(MEAL_TYPES):
+        chosen = []
+        union = 0
+        # Блюдо съедят только те, кому оно подходит
+        needed = np.ceil(portions[m] * share)
+        # Кандидаты — блюда, которые уже подавали на этот прием пищи, и новые, еще не бывавшие в меню
+        candidates = affinity[:, m] | ~affinity.any(axis=1)
+        for _ in range(min(size, len(dishes))):
+            feasible = (matrix * needed[:, None] <= remaining[None, :]).all(axis=1) & candidates
+            feasible[chosen] = False
+            if not feasible.any():
+                break
+            # Максимум учеников, которым подходит весь набор; при равенстве — лучшая ожидаемая оценка (до 5)
+            score = covered_counts(dish_masks | union, masks, counts) + ratings / 10
+            best = int(np.argmax(np.where(feasible, score, -np.inf)))
+            chosen.append(best)
+            union |= int(dish_masks[best])
+            remaining -= matrix[best] * needed[best]
+        set_covered = int(covered_counts(np.array([union], dtype=np.int64), masks, counts)[0])
+        proposal[meal_type] = {
+            'dish_ids': [dish_ids[i] for i in chosen],
+            'names': [dishes[i][1] for i in chosen],
+            'covered': set_covered,
+            'portions': int(portions[m]),
+            'short': len(chosen) < size,
+        }
+
+    return {
+        'date': date,
+        'students': students,
+        'dishes': [
+            {'id': row[0], 'name': row[1], 'price': row[2], 'excluded': students - int(covered[i]),
+             'share': round(float(share[i]) * 100), 'rating': round(float(ratings[i]), 2),
+             'reviews': int(review_counts[i]),
+             'in_stock': None if np.isinf(portions_in_stock[i]) else int(portions_in_stock[i])}
+            for i, row in enumerate(dishes)
+        ],
+        'proposal': proposal,
+    }
+
+
+def excluded_by_dish(dish_masks):
+    # Для формы меню: сколько учеников не могут есть каждое блюдо
+    masks, counts = alergen_histogram()
+    return int(counts.sum()) - covered_counts(np.array(dish_masks, dtype=np.int64), masks, counts)
@@ -0,0 +1,48 @@
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Dish, Reviews
+
+RATING_VALUES = range(1, 6)
+
+
+def apply_rating_delta(dish_id, value, sign):
+    # Один UPDATE: правые части считаются по старым значениям строки, поэтому среднее берем со сдвигом
+    Dish.objects.filter(pk=dish_id).update(
+        rating_count=F('rating_count') + sign,
+        rating_sum=F('rating_sum') + sign * value,
+        rating_avg=Coalesce(
+            Cast(F('rating_sum') + sign * value, FloatField()) / NullIf(F('rating_count') + sign, 0),
+            Value(0.0),
+        ),
+        **{f'rating_{value}': F(f'rating_{value}') + sign},
+    )
+
+
+def aggregate_ratings():
+    return {
+        row['dish_id']: row for row in Reviews.objects.order_by().values('dish_id').annotate(
+            count=Count('id'), total=Sum('review'),
+            **{f'r{value}': Count('id', filter=Q(review=value)) for value in RATING_VALUES},
+        )
+    }
+
+
+def recompute_ratings(batch_size=500):
+    # Полный пересчет из Reviews; исправляет только разошедшиеся блюда и возвращает их число
+    rows = aggregate_ratings()
+    changed = []
+    for dish in Dish.objects.only('id', *Dish.RATING_FIELDS).iterator(chunk_size=2000):
+        row = rows.get(dish.id, {})
+        values = {
+            'rating_count': row.get('count', 0),
+            'rating_sum': row.get('total') or 0,
+            **{f'rating_{value}': row.get(f'r{value}', 0) for value in RATING_VALUES},
+        }
+        values['rating_avg'] = values['rating_sum'] / values['rating_count'] if values['rating_count'] else 0
+        if any(getattr(dish, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(dish, field, value)
+            changed.append(dish)
+    Dish.objects.bulk_update(changed, Dish.RATING_FIELDS, batch_size=batch_size)
+    return len(changed)
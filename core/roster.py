@@ -0,0 +1,182 @@
+import csv
+import io
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from .ledger import opening_entries
+from .planner import invalidate_histogram
+from .models import User, Alergen, BalanceEntry, alergens_to_mask
+from .search import index_objects
+
+ROSTER_COLUMNS = ['login', 'email', 'name', 'birth_date', 'alergens', 'balance', 'password']
+REQUIRED_COLUMNS = ['login', 'email', 'name']
+
+
+class RosterError(Exception):
+    def __init__(self, errors):
+        super().__init__(f'Ошибок в файле: {len(errors)}')
+        self.errors = errors
+
+
+def parse_date(value):
+    for fmt in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(value)
+
+
+def read_roster(file_obj):
+    if isinstance(file_obj, (bytes, bytearray)):
+        file_obj = io.StringIO(file_obj.decode('utf-8-sig'))
+    header = file_obj.readline()
+    file_obj.seek(0)
+    delimiter = max(',;\t', key=header.count)
+    return list(csv.DictReader(file_obj, delimiter=delimiter))
+
+
+def validate_roster(records):
+    errors = []
+    missing = [c for c in REQUIRED_COLUMNS if records and c not in records[0]]
+    if missing:
+        raise RosterError([f'Нет колонок: {", ".join(missing)}'])
+    
+    alergens = {a.name.casefold(): a.id for a in Alergen.objects.all()}
+    logins = [(r.get('login') or '').strip() for r in records]
+    # Регистр не важен только в домене; занятость и повторы сверяем без учета регистра
+    emails = [User.objects.normalize_email((r.get('email') or '').strip()) for r in records]
+    taken_logins = set(User.objects.filter(login__in=logins).values_list('login', flat=True))
+    taken_emails = {e.lower() for e in User.objects.filter(email__in=emails).values_list('email', flat=True)}
+    
+    rows = []
+    seen_logins = set()
+    seen_emails = set()
+    for line, (record, login, email) in enumerate(zip(records, logins, emails), start=2):
+        row_errors = []
+        name = (record.get('name') or '').strip()
+        if not login:
+            row_errors.append('пустой логин')
+        elif login in taken_logins or login in seen_logins:
+            row_errors.append(f'логин {login} уже занят')
+        try:
+            validate_email(email)
+        except ValidationError:
+            row_errors.append(f'некорректный email {email}')
+        else:
+            if email.lower() in taken_emails or email.lower() in seen_emails:
+                row_errors.append(f'email {email} уже занят')
+        if not name:
+            row_errors.append('пустое ФИО')
+        
+        birth_date = None
+        if (record.get('birth_date') or '').strip():
+            try:
+                birth_date = parse_date(record['birth_date'].strip())
+            except ValueError:
+                row_errors.append(f'некорректная дата рождения {record["birth_date"]}')
+        
+        alergen_ids = []
+        for alergen_name in (record.get('alergens') or '').replace('|', ';').split(';'):
+            alergen_name = alergen_name.strip()
+            if not alergen_name:
+                continue
+            if alergen_name.casefold() not in alergens:
+                row_errors.append(f'неизвестный аллерген {alergen_name}')
+            else:
+                alergen_ids.append(alergens[alergen_name.casefold()])
+        
+        balance = (record.get('balance') or '0').strip()
+        if not balance.isdigit():
+            row_errors.append(f'некорректный баланс {balance}')
+        
+        if row_errors:
+            errors.append(f'Строка {line}: {"; ".join(row_errors)}')
+            continue
+        seen_logins.add(login)
+        seen_emails.add(email.lower())
+        rows.append({
+            'login': login,
+            'email': email,
+            'name': name,
+            'birth_date': birth_date,
+            'alergens': sorted(set(alergen_ids)),
+            'balance': int(balance),
+            'password': (record.get('password') or '').strip(),
+        })
+    
+    if errors:
+        raise RosterError(errors)
+    return rows
+
+
+def init_worker():
+    django.setup()
+
+
+def hash_passwords(passwords, workers=1):
+    # Пул процессов — только для команды import_roster; в веб-запросе хешируем последовательно
+    if workers == 1 or len(passwords) < 50:
+        return [make_password(p) for p in passwords]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        return list(pool.map(make_password, passwords, chunksize=64))
+
+
+def import_roster(rows, dry_run=False, batch_size=500, workers=1):
+    started = time.monotonic()
+    credentials = []
+    passwords = []
+    for row in rows:
+        password = row['password']
+        if not password:
+            password = secrets.token_urlsafe(6)
+            credentials.append((row['login'], password))
+        passwords.append(password)
+    
+    created = 0
+    if not dry_run:
+        # Хеширование — самая дорогая часть импорта; пробный прогон его не платит
+        hashed = hash_passwords(passwords, workers)
+        UserAlergen = User.alergens.through
+        with transaction.atomic():
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                users = User.objects.bulk_create([
+                    User(
+                        login=row['login'], email=row['email'], name=row['name'], birth_date=row['birth_date'],
+                        role='student', balance=row['balance'], password=password,
+                        alergens_mask=alergens_to_mask(row['alergens']),
+                    )
+                    for row, password in zip(batch, hashed[start:start + batch_size])
+                ])
+                if any(user.pk is None for user in users):
+                    ids = dict(User.objects.filter(login__in=[u.login for u in users]).values_list('login', 'id'))
+                    for user in users:
+                        user.pk = ids[user.login]
+                UserAlergen.objects.bulk_create([
+                    UserAlergen(user_id=user.pk, alergen_id=alergen_id)
+                    for user, row in zip(users, batch) for alergen_id in row['alergens']
+                ])
+                # bulk_create не отправляет post_save, поэтому поисковый индекс и журнал пополняем сами
+                index_objects('user', users)
+                BalanceEntry.objects.bulk_create(opening_entries(users))
+                created += len(users)
+        invalidate_histogram()
+    
+    seconds = time.monotonic() - started
+    return {
+        'rows': len(rows),
+        'created': created,
+        'seconds': seconds,
+        'rate': len(rows) / seconds if seconds else 0,
+        'credentials': credentials,
+        'dry_run': dry_run,
+    }
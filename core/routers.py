@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+read_only = ContextVar('read_only_db', default=False)
+
+
+def replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in connections.databases else None
+
+
+@contextmanager
+def use_replica():
+    token = read_only.set(True)
+    try:
+        yield
+    finally:
+        read_only.reset(token)
+
+
+class ReplicaRouter:
+    # Чтение уходит на реплику только внутри use_replica(); запись всегда на основную базу
+    def db_for_read(self, model, **hints):
+        if read_only.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплика — копия основной базы, миграции на нее не применяются
+        return db != replica_alias()
@@ -0,0 +1,124 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import User, Dish, Product
+
+SEARCH_TABLE = 'core_search'
+TOKEN_RE = re.compile(r'\w+')
+
+# Поля, по которым ищется каждый тип объектов
+SEARCH_FIELDS = {
+    'user': (User, ('login', 'name', 'email')),
+    'dish': (Dish, ('name',)),
+    'product': (Product, ('name',)),
+}
+
+
+def normalize(text):
+    # unicode61 сам приводит регистр кириллицы, но «ё» и «е» для него разные буквы
+    return (text or '').casefold().replace('ё', 'е')
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def kind_of(obj):
+    for kind, (model, fields) in SEARCH_FIELDS.items():
+        if isinstance(obj, model):
+            return kind
+    return None
+
+
+def document(kind, obj):
+    fields = SEARCH_FIELDS[kind][1]
+    return normalize(' '.join(str(getattr(obj, field) or '') for field in fields))
+
+
+def index_objects(kind, objects):
+    if not fts_enabled():
+        return
+    rows = [(kind, obj.pk, document(kind, obj)) for obj in objects]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        ids = [row[1] for row in rows]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE kind = %s AND object_id IN ({', '.join(['%s'] * len(chunk))})",
+                [kind, *chunk]
+            )
+        cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (kind, object_id, content) VALUES (%s, %s, %s)', rows)
+
+
+def unindex_object(kind, object_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE kind = %s AND object_id = %s', [kind, object_id])
+
+
+def rebuild_index():
+    counts = {}
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    for kind, (model, fields) in SEARCH_FIELDS.items():
+        objects = model.objects.only('pk', *fields).order_by('pk')
+        batch = []
+        for obj in objects.iterator(chunk_size=2000):
+            batch.append(obj)
+            if len(batch) == 2000:
+                index_objects(kind, batch)
+                batch = []
+        index_objects(kind, batch)
+        counts[kind] = objects.count()
+    return counts
+
+
+def match_expression(query):
+    # Каждое слово — префиксный поиск, слова объединяются через AND
+    tokens = TOKEN_RE.findall(normalize(query))
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def filter_queryset(queryset, kind, query):
+    expression = match_expression(query)
+    if not expression:
+        return queryset
+    if fts_enabled():
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT object_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND kind = %s',
+            (expression, kind)
+        ))
+    # На других СУБД — icontains по каждому слову: UPPER(col::text) LIKE UPPER(...) совпадает
+    # с выражением триграммных индексов (миграция 0014), поэтому PostgreSQL их использует
+    fields = SEARCH_FIELDS[kind][1]
+    for token in TOKEN_RE.findall(query):
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': token})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def search(kind, query, limit=10):
+    model = SEARCH_FIELDS[kind][0]
+    expression = match_expression(query)
+    if not expression:
+        return []
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT object_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND kind = %s '
+                f'ORDER BY rank LIMIT %s',
+                [expression, kind, limit]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        objects = model.objects.in_bulk(ids)
+        return [objects[i] for i in ids if i in objects]
+    return list(filter_queryset(model.objects.all(), kind, query).order_by('name')[:limit])
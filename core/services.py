@@ -0,0 +1,323 @@
+from datetime import date as date_cls, timedelta
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .db import retry_on_locked
+from .inventory import consume_portions
+from .models import User, Dish, Menu, Attendance, Subscription, Payment, BalanceEntry
+from .menu_cache import get_daily_menu
+from .stats import record_meals, record_daily_stats
+from .student_status import get_today_status, invalidate_today_status
+
+MEAL_COUNTERS = {
+    'breakfast': 'given_breakfasts_amount',
+    'lunch': 'given_lunches_amount',
+}
+
+ISSUE_STATUSES = {
+    'paid': 'Выдано, списано с баланса',
+    'subscription': 'Выдано по абонементу',
+    'already_taken': 'Уже получал сегодня',
+    'duplicate': 'Повтор в списке',
+    'no_funds': 'Недостаточно средств',
+    'no_stock': 'Порции закончились',
+    'not_found': 'Ученик не найден',
+}
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class CheckoutRace(CheckoutError):
+    # Данные изменились параллельно — ту же выдачу можно повторить
+    pass
+
+
+@retry_on_locked
+def take_meal(user, meal_type, date=None):
+    if meal_type not in MEAL_COUNTERS:
+        raise CheckoutError('Неизвестный тип питания')
+    date = date or timezone.now().date()
+    menu = get_daily_menu(date)
+    if not menu:
+        raise CheckoutError('Меню на сегодня не найдено')
+    
+    dish_ids = [d['id'] for d in menu[meal_type]]
+    total_price = sum(d['price'] for d in menu[meal_type])
+    
+    # Статус из кэша отсекает очевидный повтор; окончательно решает уникальность Attendance
+    status = get_today_status(user, date)
+    if status[f'{meal_type}_taken']:
+        raise CheckoutError('Вы уже получали это питание сегодня')
+    charged = 0 if status[f'{meal_type}_covered'] else total_price
+    
+    try:
+        with transaction.atomic():
+            # Вставка первой: уникальность Attendance отсекает повтор и берет блокировку на запись
+            attendance = Attendance.objects.create(user=user, date=date, meal_type=meal_type, price=charged)
+            
+            if charged:
+                debited = User.objects.filter(pk=user.pk, balance__gte=charged).update(
+                    balance=F('balance') - charged
+                )
+                if not debited:
+                    raise CheckoutError(f'Недостаточно средств. Необходимо: {charged} руб.')
+                BalanceEntry.objects.create(user=user, kind='meal', amount=-charged,
+                                            reference=f'attendance:{attendance.id}')
+            
+            if dish_ids:
+                served = Dish.objects.filter(id__in=dish_ids, amount__gt=0).update(amount=F('amount') - 1)
+                if served != len(dish_ids):
+                    raise CheckoutError('Некоторые блюда закончились')
+            
+            counter = MEAL_COUNTERS[meal_type]
+            Menu.objects.filter(pk=menu['id']).update(**{counter: F(counter) + 1})
+            if settings.INVENTORY_CONSUME_AT_CHECKOUT:
+                consume_portions(menu['id'], meal_type, 1)
+            record_meals(date, meal_type, 1, charged)
+    except IntegrityError:
+        invalidate_today_status([user.pk], date)
+        raise CheckoutError('Вы уже получали это питание сегодня')
+    
+    invalidate_today_status([user.pk], date)
+    user.balance -= charged
+    return charged
+
+
+@retry_on_locked
+def top_up_balance(user, amount):
+    # F()-обновление: пополнение не затирает одновременное списание за питание
+    with transaction.atomic():
+        payment = Payment.objects.create(user=user, amount=amount, succesful=True)
+        User.objects.filter(pk=user.pk).update(balance=F('balance') + amount)
+        BalanceEntry.objects.create(user=user, kind='topup', amount=amount, reference=f'payment:{payment.id}')
+        record_daily_stats(payment.date, payments_total=amount, payments_count=1)
+    invalidate_today_status([user.pk])
+    user.balance += amount
+    return payment
+
+
+@retry_on_locked
+def adjust_balance(user, amount, reference=''):
+    # Ручная корректировка: тот же F()-сдвиг, что у пополнения, и запись в журнал
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(balance=F('balance') + amount)
+        entry = BalanceEntry.objects.create(user=user, kind='adjustment', amount=amount, reference=reference)
+    invalidate_today_status([user.pk])
+    user.balance += amount
+    return entry
+
+
+@retry_on_locked
+def buy_subscription(user, duration, meal_type, price, date=None, auto_renew=False):
+    date = date or timezone.now().date()
+    with transaction.atomic():
+        if not User.objects.filter(pk=user.pk, balance__gte=price).update(balance=F('balance') - price):
+            raise CheckoutError(f'Недостаточно средств. Необходимо: {price} руб.')
+        subscription = Subscription.objects.create(
+            user=user,
+            duration=duration,
+            end_date=date + timedelta(days=duration),
+            meal_type=meal_type,
+            price=price,
+            auto_renew=auto_renew
+        )
+        BalanceEntry.objects.create(user=user, kind='subscription', amount=-price,
+                                    reference=f'subscription:{subscription.id}')
+    invalidate_today_status([user.pk], date)
+    user.balance -= price
+    return subscription
+
+
+@retry_on_locked
+def issue_meals(identifiers, meal_type, date=None, offline=False):
+    if meal_type not in MEAL_COUNTERS:
+        raise CheckoutError('Неизвестный тип питания')
+    date = date or timezone.now().date()
+    menu = get_daily_menu(date)
+    if not menu:
+        raise CheckoutError('Меню на сегодня не найдено')
+    
+    dish_ids = [d['id'] for d in menu[meal_type]]
+    total_price = sum(d['price'] for d in menu[meal_type])
+    # Числа — id учеников, строки — коды карт (логины); цифровой код сначала ищем среди логинов.
+    # bool — тоже int, но id ученика быть не может
+    identifiers = [x if isinstance(x, int) else str(x).strip() for x in identifiers if str(x).strip()]
+    codes = [x for x in identifiers if isinstance(x, str)]
+    ids = [x for x in identifiers if isinstance(x, int) and not isinstance(x, bool)] + [int(x) for x in codes if x.isdigit()]
+    
+    with transaction.atomic():
+        candidates = list(
+            User.objects.select_for_update()
+            .filter(Q(id__in=ids) | Q(login__in=codes))
+            .only('id', 'login', 'name', 'balance', 'role')
+        )
+        by_id = {u.id: u for u in candidates}
+        by_login = {u.login: u for u in candidates}
+        # Ученик по позиции в списке: ключи словаря склеили бы 1 и True
+        resolved = []
+        for x in identifiers:
+            if isinstance(x, bool):
+                user = None
+            elif isinstance(x, int):
+                user = by_id.get(x)
+            else:
+                user = by_login.get(x) or (by_id.get(int(x)) if x.isdigit() else None)
+            resolved.append(user if user is not None and user.role == 'student' else None)
+        users = list({user.id: user for user in resolved if user is not None}.values())
+        user_ids = [u.id for u in users]
+        taken = set(Attendance.objects.filter(
+            user_id__in=user_ids, date=date, meal_type=meal_type
+        ).values_list('user_id', flat=True))
+        subscribed = set(Subscription.objects.active(date).filter(
+            user_id__in=user_ids, meal_type__in=[meal_type, 'both']
+        ).values_list('user_id', flat=True))
+        # Порций хватит не всем — выдаем по порядку списка, остальным no_stock.
+        # Офлайн-выдачи уже состоялись: записываем их, даже если склад ушел в ноль
+        stock = min(Dish.objects.filter(id__in=dish_ids).values_list('amount', flat=True), default=None)
+        
+        results = {}
+        issued = []
+        payers = []
+        for user in users:
+            if user.id in taken:
+                status = 'already_taken'
+            elif not offline and stock is not None and len(issued) >= stock:
+                status = 'no_stock'
+            elif user.id in subscribed:
+                status = 'subscription'
+                issued.append(user)
+            elif user.balance >= total_price:
+                status = 'paid'
+                issued.append(user)
+                if total_price:
+                    payers.append(user.id)
+            else:
+                status = 'no_funds'
+            results[user.id] = {'user_id': user.id, 'login': user.login, 'name': user.name, 'status': status,
+                                'message': ISSUE_STATUSES[status], 'charged': total_price if status == 'paid' else 0}
+        
+        if issued:
+            count = len(issued)
+            if dish_ids and offline:
+                Dish.objects.filter(id__in=dish_ids).update(amount=Greatest(F('amount') - count, 0))
+            elif dish_ids:
+                served = Dish.objects.filter(id__in=dish_ids, amount__gte=count).update(amount=F('amount') - count)
+                if served != len(dish_ids):
+                    raise CheckoutRace('Остатки блюд изменились во время выдачи, повторите попытку')
+            if payers:
+                debited = User.objects.filter(id__in=payers, balance__gte=total_price).update(
+                    balance=F('balance') - total_price
+                )
+                if debited != len(payers):
+                    raise CheckoutRace('Балансы изменились во время выдачи, повторите попытку')
+                BalanceEntry.objects.bulk_create([
+                    BalanceEntry(user_id=user_id, kind='meal', amount=-total_price, reference=f'issue:{date}:{meal_type}')
+                    for user_id in payers
+                ], batch_size=500)
+            try:
+                Attendance.objects.bulk_create([
+                    Attendance(user=user, date=date, meal_type=meal_type, price=results[user.id]['charged'])
+                    for user in issued
+                ], batch_size=500)
+            except IntegrityError:
+                raise CheckoutRace('Часть учеников получила питание во время выдачи, повторите попытку')
+            counter = MEAL_COUNTERS[meal_type]
+            Menu.objects.filter(pk=menu['id']).update(**{counter: F(counter) + count})
+            if settings.INVENTORY_CONSUME_AT_CHECKOUT:
+                consume_portions(menu['id'], meal_type, count)
+            record_meals(date, meal_type, count, total_price * len(payers))
+    invalidate_today_status([user.id for user in issued], date)
+    
+    # Результат выдачи — первому упоминанию ученика, повторам в списке — duplicate, чтобы их не считали выданными
+    response = []
+    seen = set()
+    for x, user in zip(identifiers, resolved):
+        if user is None:
+            item = {'status': 'not_found', 'message': ISSUE_STATUSES['not_found'], 'charged': 0}
+        elif user.id in seen:
+            item = dict(results[user.id], status='duplicate', message=ISSUE_STATUSES['duplicate'], charged=0)
+        else:
+            seen.add(user.id)
+            item = results[user.id]
+        response.append(dict(item, identifier=x))
+    return response
+
+
+def build_kiosk_snapshot(date=None):
+    date = date or timezone.now().date()
+    menu = get_daily_menu(date) or {}
+    subscriptions = {}
+    for user_id, meal_type in Subscription.objects.active(date).values_list('user_id', 'meal_type'):
+        subscriptions[user_id] = meal_type if subscriptions.get(user_id, meal_type) == meal_type else 'both'
+    taken = {}
+    for user_id, meal_type in Attendance.objects.filter(date=date).values_list('user_id', 'meal_type'):
+        taken.setdefault(user_id, []).append(meal_type)
+    students = User.objects.filter(role='student', is_active=True).values_list('id', 'login', 'name', 'balance')
+    return {
+        'date': date.isoformat(),
+        'prices': {meal: sum(d['price'] for d in menu.get(meal, [])) for meal in MEAL_COUNTERS},
+        'menu': {meal: [d['name'] for d in menu.get(meal, [])] for meal in MEAL_COUNTERS},
+        'fields': ['id', 'login', 'name', 'balance', 'subscription', 'taken'],
+        'students': [
+            [user_id, login, name, balance, subscriptions.get(user_id), taken.get(user_id, [])]
+            for user_id, login, name, balance in students.iterator()
+        ],
+    }
+
+
+def sync_pickups(pickups):
+    today = timezone.now().date()
+    results = []
+    groups = {}
+    seen = set()
+    for pickup in pickups:
+        result = {'id': pickup.get('id')}
+        results.append(result)
+        # Киоск присылает id ученика; старые записи очереди — только код из поля student
+        student = pickup.get('user_id')
+        if not isinstance(student, int) or isinstance(student, bool):
+            student = str(pickup.get('student', '')).strip()
+        meal_type = pickup.get('meal_type')
+        try:
+            date = date_cls.fromisoformat(pickup.get('date') or today.isoformat())
+        except (TypeError, ValueError):
+            date = None
+        if not student or meal_type not in MEAL_COUNTERS or date is None or date > today:
+            result.update(status='conflict', message='Некорректная запись')
+        elif (student, date, meal_type) in seen:
+            result.update(status='duplicate', message='Повтор в очереди')
+        else:
+            seen.add((student, date, meal_type))
+            groups.setdefault((date, meal_type), []).append((student, result))
+    
+    for (date, meal_type), items in groups.items():
+        try:
+            issued = issue_meals([student for student, _ in items], meal_type, date, offline=True)
+        except CheckoutRace as e:
+            for _, result in items:
+                result.update(status='retry', message=str(e))
+            continue
+        except CheckoutError as e:
+            # Например, нет меню на эту дату: повтор не поможет
+            for _, result in items:
+                result.update(status='conflict', message=str(e))
+            continue
+        issued_users = set()
+        for (_, result), item in zip(items, issued):
+            if item['status'] in ('paid', 'subscription') and item['user_id'] in issued_users:
+                status = 'duplicate'
+            elif item['status'] in ('paid', 'subscription'):
+                status = 'accepted'
+                issued_users.add(item['user_id'])
+            elif item['status'] in ('already_taken', 'duplicate'):
+                status = 'duplicate'
+            else:
+                status = 'conflict'
+            result.update(status=status, message=item['message'], charged=item['charged'])
+    return results
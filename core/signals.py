@@ -0,0 +1,128 @@
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import User, Product, Dish, DishProduct, Menu, MenuDish, Reviews, BalanceEntry, menu_dishes_set
+from .menu_cache import invalidate_menu_cache
+from .planner import invalidate_histogram
+from .ratings import apply_rating_delta
+from .search import SEARCH_FIELDS, kind_of, index_objects, unindex_object
+
+
+# ID объектов прямой стороны m2m, затронутых изменением связи
+def changed_ids(instance, action, reverse, pk_set, related_name):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_ids = list(getattr(instance, related_name).values_list('id', flat=True))
+        return None
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return None
+    if not reverse:
+        return [instance.pk]
+    if action == 'post_clear':
+        return getattr(instance, '_cleared_ids', [])
+    return pk_set
+
+
+@receiver(m2m_changed, sender=User.alergens.through)
+def user_alergens_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    user_ids = changed_ids(instance, action, reverse, pk_set, 'users')
+    if user_ids:
+        for user in User.objects.filter(id__in=user_ids):
+            user.refresh_alergens_mask()
+        invalidate_histogram()
+
+
+@receiver(m2m_changed, sender=Product.alergens.through)
+def product_alergens_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    product_ids = changed_ids(instance, action, reverse, pk_set, 'products')
+    if product_ids:
+        Dish.refresh_alergens_masks(
+            DishProduct.objects.filter(product_id__in=product_ids).values_list('dish_id', flat=True)
+        )
+        invalidate_menu_cache()
+
+
+@receiver(m2m_changed, sender=Dish.products.through)
+def dish_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    dish_ids = changed_ids(instance, action, reverse, pk_set, 'dishes')
+    if dish_ids:
+        Dish.refresh_alergens_masks(dish_ids)
+        invalidate_menu_cache()
+
+
+@receiver(post_save, sender=DishProduct)
+@receiver(post_delete, sender=DishProduct)
+def dish_product_saved(sender, instance, **kwargs):
+    Dish.refresh_alergens_masks([instance.dish_id])
+    invalidate_menu_cache()
+
+
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+@receiver(post_save, sender=MenuDish)
+@receiver(post_delete, sender=MenuDish)
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+@receiver(menu_dishes_set, sender=Menu)
+def menu_data_changed(sender, **kwargs):
+    invalidate_menu_cache()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Dish)
+@receiver(post_save, sender=Product)
+def search_object_saved(sender, instance, update_fields=None, **kwargs):
+    kind = kind_of(instance)
+    # Сохранение last_login, баланса и т.п. не меняет индексируемых полей
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELDS[kind][1]):
+        return
+    index_objects(kind, [instance])
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    # Начальный баланс нового пользователя тоже должен быть в журнале
+    if created and not raw and instance.balance:
+        BalanceEntry.objects.create(user=instance, kind='adjustment', amount=instance.balance, reference='opening')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_population_changed(sender, instance, update_fields=None, **kwargs):
+    # Гистограмма аллергенов зависит от роли и активности; сохранение last_login ее не меняет
+    if update_fields is None or {'role', 'is_active'} & set(update_fields):
+        invalidate_histogram()
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Dish)
+@receiver(post_delete, sender=Product)
+def search_object_deleted(sender, instance, **kwargs):
+    unindex_object(kind_of(instance), instance.pk)
+
+
+@receiver(pre_save, sender=Reviews)
+def review_saving(sender, instance, raw=False, **kwargs):
+    # Старая оценка нужна, чтобы при правке отзыва перенести голос между корзинами распределения
+    instance._previous = None
+    if instance.pk and not raw:
+        instance._previous = Reviews.objects.filter(pk=instance.pk).values_list('dish_id', 'review').first()
+
+
+@receiver(post_save, sender=Reviews)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    current = (instance.dish_id, instance.review)
+    if previous == current:
+        return
+    if previous:
+        apply_rating_delta(previous[0], previous[1], -1)
+    apply_rating_delta(instance.dish_id, instance.review, 1)
+    invalidate_menu_cache()
+
+
+@receiver(post_delete, sender=Reviews)
+def review_deleted(sender, instance, **kwargs):
+    apply_rating_delta(instance.dish_id, instance.review, -1)
+    invalidate_menu_cache()
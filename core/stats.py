@@ -0,0 +1,74 @@
+from django.db import transaction, IntegrityError
+from django.db.models import F, Sum, Count
+
+from .models import DailyStats, Payment, Attendance, Applications
+
+STATS_FIELDS = ['payments_total', 'payments_count', 'breakfasts', 'lunches',
+                'breakfast_revenue', 'lunch_revenue', 'purchases_total']
+
+
+def record_daily_stats(date, **deltas):
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    increments = {k: F(k) + v for k, v in deltas.items()}
+    if DailyStats.objects.filter(date=date).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            DailyStats.objects.create(date=date, **deltas)
+    except IntegrityError:
+        DailyStats.objects.filter(date=date).update(**increments)
+
+
+def record_meals(date, meal_type, count, revenue):
+    if meal_type == 'breakfast':
+        record_daily_stats(date, breakfasts=count, breakfast_revenue=revenue)
+    else:
+        record_daily_stats(date, lunches=count, lunch_revenue=revenue)
+
+
+def summarize_daily_stats(start_date, end_date):
+    totals = DailyStats.objects.filter(date__gte=start_date, date__lte=end_date).aggregate(
+        **{field: Sum(field) for field in STATS_FIELDS}
+    )
+    return {field: value or 0 for field, value in totals.items()}
+
+
+def rebuild_daily_stats(start_date=None, end_date=None):
+    def in_range(queryset):
+        if start_date:
+            queryset = queryset.filter(date__gte=start_date)
+        if end_date:
+            queryset = queryset.filter(date__lte=end_date)
+        return queryset.order_by()
+    
+    rows = {}
+    
+    def row(date):
+        return rows.setdefault(date, DailyStats(date=date))
+    
+    for item in in_range(Payment.objects.filter(succesful=True)).values('date').annotate(
+            total=Sum('amount'), count=Count('id')):
+        stats = row(item['date'])
+        stats.payments_total = item['total'] or 0
+        stats.payments_count = item['count']
+    
+    for item in in_range(Attendance.objects.all()).values('date', 'meal_type').annotate(
+            count=Count('id'), revenue=Sum('price')):
+        stats = row(item['date'])
+        if item['meal_type'] == 'breakfast':
+            stats.breakfasts = item['count']
+            stats.breakfast_revenue = item['revenue'] or 0
+        else:
+            stats.lunches = item['count']
+            stats.lunch_revenue = item['revenue'] or 0
+    
+    for item in in_range(Applications.objects.filter(status='approved')).values('date').annotate(
+            total=Sum('price')):
+        row(item['date']).purchases_total = item['total'] or 0
+    
+    with transaction.atomic():
+        in_range(DailyStats.objects.all()).delete()
+        DailyStats.objects.bulk_create(rows.values(), batch_size=500)
+    return len(rows)
@@ -0,0 +1,68 @@
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import User, Attendance, Subscription
+
+
+def status_key(user_id, date):
+    return f'student-status:{user_id}:{date.isoformat()}'
+
+
+def seconds_until_tomorrow(date):
+    tomorrow = timezone.make_aware(datetime.combine(date + timedelta(days=1), time.min))
+    return max(int((tomorrow - timezone.now()).total_seconds()), 60)
+
+
+def load_today_status(user_id, date):
+    attendance = Attendance.objects.filter(user=OuterRef('pk'), date=date)
+    subscriptions = Subscription.objects.active(date).filter(user=OuterRef('pk'))
+    active = subscriptions.order_by('-end_date', '-id')
+    row = User.objects.filter(pk=user_id).annotate(
+        breakfast_taken=Exists(attendance.filter(meal_type='breakfast')),
+        lunch_taken=Exists(attendance.filter(meal_type='lunch')),
+        breakfast_covered=Exists(subscriptions.filter(meal_type__in=['breakfast', 'both'])),
+        lunch_covered=Exists(subscriptions.filter(meal_type__in=['lunch', 'both'])),
+        subscription_id=Subquery(active.values('id')[:1]),
+        subscription_meal_type=Subquery(active.values('meal_type')[:1]),
+        subscription_end_date=Subquery(active.values('end_date')[:1]),
+        subscription_duration=Subquery(active.values('duration')[:1]),
+    ).values(
+        'balance', 'breakfast_taken', 'lunch_taken', 'breakfast_covered', 'lunch_covered',
+        'subscription_id', 'subscription_meal_type', 'subscription_end_date', 'subscription_duration',
+    ).first()
+    if row is None:
+        return None
+    subscription = None
+    if row['subscription_id']:
+        subscription = Subscription(
+            id=row['subscription_id'], user_id=user_id, meal_type=row['subscription_meal_type'],
+            end_date=row['subscription_end_date'], duration=row['subscription_duration'],
+        )
+    return {
+        'balance': row['balance'],
+        'breakfast_taken': row['breakfast_taken'],
+        'lunch_taken': row['lunch_taken'],
+        'breakfast_covered': row['breakfast_covered'],
+        'lunch_covered': row['lunch_covered'],
+        'subscription': subscription,
+    }
+
+
+def get_today_status(user, date=None):
+    # Отметки о питании, абонемент и баланс ученика на день одним запросом, с кэшем до конца дня
+    date = date or timezone.now().date()
+    key = status_key(user.pk, date)
+    status = cache.get(key)
+    if status is None:
+        status = load_today_status(user.pk, date)
+        if status is not None:
+            cache.set(key, status, seconds_until_tomorrow(date))
+    return status
+
+
+def invalidate_today_status(user_ids, date=None):
+    date = date or timezone.now().date()
+    cache.delete_many([status_key(user_id, date) for user_id in user_ids])
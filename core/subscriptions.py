@@ -0,0 +1,167 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When, Window
+
+from .db import retry_on_locked
+from .models import User, Subscription, BalanceEntry, Notification
+from .student_status import invalidate_today_status
+
+# За сколько дней до окончания предупреждать, что на автопродление не хватит денег
+LOW_BALANCE_NOTICE_DAYS = 3
+# Сколько раз переигрывать пачку продлений, если баланс ученика изменился между проверкой и списанием
+RENEW_CONFLICT_RETRIES = 3
+
+logger = logging.getLogger(__name__)
+
+
+class RenewalConflict(Exception):
+    pass
+
+
+def renewal_amounts(rows):
+    # Все подлежащие продлению абонементы ученика продлеваются вместе: одна сумма на пользователя
+    amounts = {}
+    for row in rows:
+        amounts[row['user_id']] = amounts.get(row['user_id'], 0) + row['price']
+    return amounts
+
+
+@retry_on_locked
+def renew_batch(ids, today):
+    with transaction.atomic():
+        # Пачку перечитываем внутри транзакции: параллельный запуск или повтор мог уже продлить часть абонементов
+        rows = list(Subscription.objects.select_for_update().filter(
+            id__in=ids, status='active', auto_renew=True, end_date__lte=today,
+        ).values('id', 'user_id', 'duration', 'meal_type', 'price', 'end_date'))
+        if not rows:
+            return 0
+        amounts = renewal_amounts(rows)
+        # Различных сумм — единицы (тарифов немного), поэтому ветвь CASE на сумму, а не на пользователя
+        by_total = {}
+        for user_id, total in amounts.items():
+            by_total.setdefault(total, []).append(user_id)
+        amount = Case(*[When(id__in=user_ids, then=Value(total)) for total, user_ids in by_total.items()],
+                      output_field=IntegerField())
+        users = User.objects.filter(id__in=amounts, balance__gte=amount)
+        paid = set(users.values_list('id', flat=True))
+        if not paid:
+            return 0
+        # Одно условное списание на пачку; расхождение с проверкой — параллельная покупка, пачку переигрываем
+        if users.filter(id__in=paid).update(balance=F('balance') - amount) != len(paid):
+            raise RenewalConflict()
+
+        renewed = [row for row in rows if row['user_id'] in paid]
+        # Списываем только за абонементы, которые действительно перешли из active в renewed
+        moved = Subscription.objects.filter(id__in=[row['id'] for row in renewed], status='active')
+        if moved.update(status='renewed') != len(renewed):
+            raise RenewalConflict()
+        # Продление начинается со следующего дня после окончания, а для уже истекших — с сегодняшнего
+        created = Subscription.objects.bulk_create([
+            Subscription(user_id=row['user_id'], duration=row['duration'], meal_type=row['meal_type'],
+                         price=row['price'], auto_renew=True,
+                         end_date=max(row['end_date'], today - timedelta(days=1)) + timedelta(days=row['duration']))
+            for row in renewed
+        ])
+        BalanceEntry.objects.bulk_create([
+            BalanceEntry(user_id=subscription.user_id, kind='subscription', amount=-subscription.price,
+                         reference=f'renewal:{subscription.id}')
+            for subscription in created
+        ])
+        Notification.objects.bulk_create([
+            Notification(user_id=subscription.user_id, kind='renewed', reference=f'subscription:{subscription.id}',
+                         message=f'Абонемент продлен до {subscription.end_date:%d.%m.%Y}, списано {subscription.price} руб.')
+            for subscription in created
+        ], ignore_conflicts=True)
+    invalidate_today_status(paid, today)
+    return len(created)
+
+
+def renew_due(today, batch_size):
+    # Ключевой курсор по id: неоплаченные абонементы остаются активными и не должны выбираться повторно
+    due = Subscription.objects.filter(status='active', auto_renew=True, end_date__lte=today).order_by('id')
+    renewed = processed = 0
+    failed = []
+    last_id = 0
+    while True:
+        ids = list(due.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+        for _ in range(RENEW_CONFLICT_RETRIES):
+            try:
+                renewed += renew_batch(ids, today)
+                break
+            except RenewalConflict:
+                # Пачка откатилась целиком, переигрываем
+                continue
+        else:
+            # Повторы исчерпаны: эти абонементы нельзя закрывать как истекшие, их продлит следующий запуск
+            logger.warning('Пачка продлений не прошла после %s попыток: %s абонементов', RENEW_CONFLICT_RETRIES, len(ids))
+            failed.extend(ids)
+        processed += len(ids)
+    return processed, renewed, failed
+@retry_on_locked
+def expire_batch(ids, today):
+    with transaction.atomic():
+        expired = list(Subscription.objects.filter(id__in=ids, status='active', end_date__lt=today)
+                       .values_list('id', 'user_id', 'end_date'))
+        Subscription.objects.filter(id__in=[row[0] for row in expired], status='active').update(status='expired')
+        Notification.objects.bulk_create([
+            Notification(user_id=user_id, kind='expired', reference=f'subscription:{subscription_id}',
+                         message=f'Абонемент закончился {end_date:%d.%m.%Y}')
+            for subscription_id, user_id, end_date in expired
+        ], ignore_conflicts=True)
+    invalidate_today_status({row[1] for row in expired}, today)
+    return len(expired)
+
+
+def expire_due(today, batch_size, skip=()):
+    # Истекшие уходят из выборки после UPDATE, поэтому берем первую пачку, пока выборка не опустеет.
+    # skip — абонементы, продление которых не прошло: они ждут следующего запуска
+    due = Subscription.objects.filter(status='active', end_date__lt=today).exclude(id__in=skip).order_by()
+    expired = 0
+    while True:
+        ids = list(due.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        expired += expire_batch(ids, today)
+    return expired
+
+
+def low_balance_batch(rows):
+    # Уже предупрежденных пропускаем, чтобы счетчик показывал только новые уведомления
+    references = {f'subscription:{row[0]}' for row in rows}
+    sent = set(Notification.objects.filter(user_id__in={row[1] for row in rows}, kind='low_balance',
+                                           reference__in=references).order_by().values_list('user_id', 'reference'))
+    created = Notification.objects.bulk_create([
+        Notification(user_id=user_id, kind='low_balance', reference=f'subscription:{subscription_id}',
+                     message=f'Абонемент заканчивается {end_date:%d.%m.%Y}. '
+                             f'Для автопродления пополните баланс до {total} руб.')
+        for subscription_id, user_id, end_date, total in rows
+        if (user_id, f'subscription:{subscription_id}') not in sent
+    ], ignore_conflicts=True)
+    return len(created)
+
+
+def queue_low_balance(today, batch_size):
+    # Баланс сравниваем с суммой всех продлеваемых абонементов ученика, как при списании в renewal_amounts.
+    # Повторы при гонке отсекает уникальность уведомления
+    rows = Subscription.objects.filter(
+        status='active', auto_renew=True,
+        end_date__gte=today, end_date__lte=today + timedelta(days=LOW_BALANCE_NOTICE_DAYS),
+    ).annotate(
+        total=Window(Sum('price'), partition_by=F('user_id')),
+    ).filter(user__balance__lt=F('total')).values_list(
+        'id', 'user_id', 'end_date', 'total').iterator(chunk_size=batch_size)
+    queued = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            queued += low_balance_batch(batch)
+            batch = []
+    if batch:
+        queued += low_balance_batch(batch)
+    return queued
@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+student_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path('', views.login_view, name='login'),
@@ -9,17 +12,22 @@ urlpatterns = [
     
     path('dashboard/', views.dashboard, name='dashboard'),
     path('profile/', views.profile, name='profile'),
+    path('search/', views.search_suggest, name='search_suggest'),
     
-    path('student/menu/', views.student_menu, name='student_menu'),
-    path('student/take-meal/<str:meal_type>/', views.student_take_meal, name='student_take_meal'),
-    path('student/payment/', views.student_payment, name='student_payment'),
+    path('student/menu/', student_views.student_menu, name='student_menu'),
+    path('student/menu.json', async_views.student_menu_json, name='student_menu_json'),
+    path('student/take-meal/<str:meal_type>/', student_views.student_take_meal, name='student_take_meal'),
+    path('student/payment/', student_views.student_payment, name='student_payment'),
+    path('student/balance/', views.student_balance_history, name='student_balance_history'),
     path('student/subscription/', views.student_subscription, name='student_subscription'),
     path('student/reviews/', views.student_reviews, name='student_reviews'),
     path('student/reviews/add/<int:dish_id>/', views.student_add_review, name='student_add_review'),
     
     path('cook/', views.cook_dashboard, name='cook_dashboard'),
+    path('cook/consume/', views.cook_consume_inventory, name='cook_consume_inventory'),
     path('cook/menu/', views.cook_menu, name='cook_menu'),
     path('cook/menu/create/', views.cook_menu_edit, name='cook_menu_create'),
+    path('cook/menu/plan/', views.cook_menu_plan, name='cook_menu_plan'),
     path('cook/menu/<int:menu_id>/edit/', views.cook_menu_edit, name='cook_menu_edit'),
     path('cook/dishes/', views.cook_dishes, name='cook_dishes'),
     path('cook/dishes/create/', views.cook_dish_edit, name='cook_dish_create'),
@@ -27,6 +35,10 @@ urlpatterns = [
     path('cook/products/', views.cook_products, name='cook_products'),
     path('cook/products/create/', views.cook_product_edit, name='cook_product_create'),
     path('cook/products/<int:product_id>/edit/', views.cook_product_edit, name='cook_product_edit'),
+    path('cook/serve/', views.cook_serve, name='cook_serve'),
+    path('cook/kiosk/', views.cook_kiosk, name='cook_kiosk'),
+    path('cook/kiosk/snapshot/', views.cook_kiosk_snapshot, name='cook_kiosk_snapshot'),
+    path('cook/kiosk/sync/', views.cook_kiosk_sync, name='cook_kiosk_sync'),
     path('cook/applications/', views.cook_applications, name='cook_applications'),
     path('cook/applications/create/', views.cook_application_create, name='cook_application_create'),
     
@@ -35,6 +47,9 @@ urlpatterns = [
     path('admin-panel/applications/<int:app_id>/<str:action>/', views.admin_application_action, name='admin_application_action'),
     path('admin-panel/statistics/', views.admin_statistics, name='admin_statistics'),
     path('admin-panel/reports/', views.admin_reports, name='admin_reports'),
+    path('admin-panel/reports/export/<str:kind>/', views.admin_reports_export, name='admin_reports_export'),
     path('admin-panel/users/', views.admin_users, name='admin_users'),
+    path('admin-panel/users/import/', views.admin_users_import, name='admin_users_import'),
+    path('admin-panel/query-stats/', views.admin_query_stats, name='admin_query_stats'),
     path('admin-panel/alergens/', views.admin_alergens, name='admin_alergens'),
 ]
@@ -1,15 +1,32 @@
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse, StreamingHttpResponse, Http404
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
 from django.utils import timezone
-from django.db.models import Sum, Count
-from datetime import timedelta
+from django.db import transaction
+from datetime import date, timedelta
 
-from .models import User, Menu, Dish, Attendance, Payment, Subscription, Applications, Product, Reviews, Alergen
+from .models import (User, Menu, Dish, Payment, Subscription, Applications, ApplicationItem, Product, Reviews,
+                     Alergen, BalanceEntry)
 from .forms import (LoginForm, RegisterForm, ProfileForm, PaymentForm, 
-                    SubscriptionForm, ReviewForm, DishForm, MenuForm, ProductForm)
-from .decorators import student_required, cook_required, admin_required
+                    SubscriptionForm, ReviewForm, DishForm, MenuForm, ProductForm, RosterImportForm)
+from .decorators import role_required, student_required, cook_required, admin_required, read_only_view
+from .menu_cache import get_daily_menu
+from .student_status import get_today_status
+from .roster import read_roster, validate_roster, import_roster, RosterError
+from .exports import EXPORTS, stream_export, astream_export
+from .forecast import forecast_week
+from .planner import plan_menu, excluded_by_dish
+from .inventory import consume_until
+from .stats import record_daily_stats, summarize_daily_stats
+from .middleware import registry as query_stats
+from .pagination import keyset_paginate
+from .search import filter_queryset, search
+from .services import take_meal, top_up_balance, buy_subscription, issue_meals, build_kiosk_snapshot, sync_pickups, CheckoutError
 
 
 def login_view(request):
@@ -76,10 +93,7 @@ def profile(request):
     else:
         form = ProfileForm(instance=request.user)
     
-    user_alergens = []
-    if request.user.alergens:
-        ids = request.user.get_alergens_list()
-        user_alergens = Alergen.objects.filter(id__in=ids)
+    user_alergens = request.user.alergens.all()
     
     return render(request, 'profile.html', {
         'form': form,
@@ -87,98 +101,70 @@ def profile(request):
     })
 
 
+# Типы объектов, доступные для подсказок каждой роли
+SUGGEST_KINDS = {
+    'admin': ('user', 'dish', 'product'),
+    'cook': ('dish', 'product'),
+}
+
+
+@login_required
+@role_required('admin', 'cook')
+def search_suggest(request):
+    kind = request.GET.get('kind', '')
+    if kind not in SUGGEST_KINDS[request.user.role]:
+        return JsonResponse({'error': 'Неизвестный тип поиска'}, status=400)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+    results = []
+    for obj in search(kind, request.GET.get('q', ''), limit):
+        label = f'{obj.name} ({obj.login})' if kind == 'user' else obj.name
+        results.append({'id': obj.id, 'label': label, 'value': obj.login if kind == 'user' else obj.name})
+    return JsonResponse({'results': results}, json_dumps_params={'ensure_ascii': False})
+
+
 @login_required
 @student_required
 def student_menu(request):
     today = timezone.now().date()
-    menu = Menu.objects.filter(date=today).first()
-    
+    menu = get_daily_menu(today)
+    status = get_today_status(request.user, today)
+    return render(request, 'student/menu.html', menu_context(request.user, today, menu, status))
+
+
+def menu_context(user, today, menu, status):
     breakfast_dishes = []
     lunch_dishes = []
-    user_alergens = set(request.user.get_alergens_list())
+    user_mask = user.get_alergens_mask()
     
     if menu:
-        for dish in menu.get_breakfast_dishes():
-            dish_alergens = set(dish.get_alergens())
-            dish.has_allergen = bool(user_alergens & dish_alergens)
-            breakfast_dishes.append(dish)
-        
-        for dish in menu.get_lunch_dishes():
-            dish_alergens = set(dish.get_alergens())
-            dish.has_allergen = bool(user_alergens & dish_alergens)
-            lunch_dishes.append(dish)
-    
-    breakfast_taken = Attendance.objects.filter(
-        user=request.user, date=today, meal_type='breakfast'
-    ).exists()
-    lunch_taken = Attendance.objects.filter(
-        user=request.user, date=today, meal_type='lunch'
-    ).exists()
-    
-    subscription = Subscription.objects.filter(
-        user=request.user, end_date__gte=today
-    ).first()
-    
-    return render(request, 'student/menu.html', {
+        breakfast_dishes = [dict(dish, has_allergen=bool(user_mask & dish['alergens_mask']))
+                            for dish in menu['breakfast']]
+        lunch_dishes = [dict(dish, has_allergen=bool(user_mask & dish['alergens_mask']))
+                        for dish in menu['lunch']]
+    
+    return {
         'menu': menu,
         'breakfast_dishes': breakfast_dishes,
         'lunch_dishes': lunch_dishes,
-        'breakfast_taken': breakfast_taken,
-        'lunch_taken': lunch_taken,
-        'subscription': subscription,
+        'breakfast_taken': status['breakfast_taken'],
+        'lunch_taken': status['lunch_taken'],
+        'subscription': status['subscription'],
         'today': today,
-    })
+    }
 
 
 @login_required
 @student_required
 def student_take_meal(request, meal_type):
-    today = timezone.now().date()
-    
-    if Attendance.objects.filter(user=request.user, date=today, meal_type=meal_type).exists():
-        messages.error(request, 'Вы уже получали это питание сегодня')
-        return redirect('student_menu')
-    
-    subscription = Subscription.objects.filter(
-        user=request.user, end_date__gte=today
-    ).first()
-    
-    menu = Menu.objects.filter(date=today).first()
-    if not menu:
-        messages.error(request, 'Меню на сегодня не найдено')
+    try:
+        take_meal(request.user, meal_type)
+    except CheckoutError as e:
+        messages.error(request, str(e))
         return redirect('student_menu')
     
-    if meal_type == 'breakfast':
-        dishes = menu.get_breakfast_dishes()
-    else:
-        dishes = menu.get_lunch_dishes()
-    
-    total_price = sum(d.price for d in dishes)
-    
-    has_subscription = subscription and (
-        subscription.meal_type == 'both' or 
-        subscription.meal_type == meal_type
-    )
-    
-    if not has_subscription:
-        if request.user.balance < total_price:
-            messages.error(request, f'Недостаточно средств. Необходимо: {total_price} руб.')
-            return redirect('student_menu')
-        request.user.balance -= total_price
-        request.user.save()
-    
-    Attendance.objects.create(
-        user=request.user,
-        date=today,
-        meal_type=meal_type
-    )
-    
-    if meal_type == 'breakfast':
-        menu.given_breakfasts_amount += 1
-    else:
-        menu.given_lunches_amount += 1
-    menu.save()
-    
     messages.success(request, f'Питание ({meal_type}) получено!')
     return redirect('student_menu')
 
@@ -191,14 +177,7 @@ def student_payment(request):
         if form.is_valid():
             amount = form.cleaned_data['amount']
             
-            Payment.objects.create(
-                user=request.user,
-                amount=amount,
-                succesful=True
-            )
-            
-            request.user.balance += amount
-            request.user.save()
+            top_up_balance(request.user, amount)
             
             messages.success(request, f'Баланс пополнен на {amount} руб.')
             return redirect('student_menu')
@@ -213,13 +192,19 @@ def student_payment(request):
     })
 
 
+@login_required
+@student_required
+def student_balance_history(request):
+    entries = BalanceEntry.objects.filter(user=request.user)
+    page = keyset_paginate(request, entries, ('-id',), per_page=30)
+    return render(request, 'student/balance_history.html', {'entries': page, 'page': page})
+
+
 @login_required
 @student_required
 def student_subscription(request):
     today = timezone.now().date()
-    active_subscription = Subscription.objects.filter(
-        user=request.user, end_date__gte=today
-    ).first()
+    active_subscription = Subscription.objects.active(today).filter(user=request.user).order_by('-end_date').first()
     
     PRICES = {
         ('7', 'breakfast'): 700,
@@ -233,6 +218,16 @@ def student_subscription(request):
         ('30', 'both'): 5500,
     }
     
+    action = request.POST.get('action')
+    if request.method == 'POST' and action == 'auto_renew':
+        enabled = request.POST.get('auto_renew') == 'on'
+        Subscription.objects.active(today).filter(user=request.user).update(auto_renew=enabled)
+        messages.success(request, 'Автопродление включено' if enabled else 'Автопродление отключено')
+        return redirect('student_subscription')
+    if request.method == 'POST' and action == 'read':
+        request.user.notifications.filter(read_at__isnull=True).update(read_at=timezone.now())
+        return redirect('student_subscription')
+    
     if request.method == 'POST':
         form = SubscriptionForm(request.POST)
         if form.is_valid():
@@ -241,22 +236,14 @@ def student_subscription(request):
             
             price = PRICES.get((str(duration), meal_type), 0)
             
-            if request.user.balance < price:
-                messages.error(request, f'Недостаточно средств. Необходимо: {price} руб.')
+            try:
+                subscription = buy_subscription(request.user, duration, meal_type, price, today,
+                                                auto_renew=form.cleaned_data['auto_renew'])
+            except CheckoutError as e:
+                messages.error(request, str(e))
                 return redirect('student_subscription')
             
-            request.user.balance -= price
-            request.user.save()
-            
-            end_date = today + timedelta(days=duration)
-            Subscription.objects.create(
-                user=request.user,
-                duration=duration,
-                end_date=end_date,
-                meal_type=meal_type
-            )
-            
-            messages.success(request, f'Абонемент оформлен до {end_date}')
+            messages.success(request, f'Абонемент оформлен до {subscription.end_date}')
             return redirect('student_menu')
     else:
         form = SubscriptionForm()
@@ -264,6 +251,7 @@ def student_subscription(request):
     return render(request, 'student/subscription.html', {
         'form': form,
         'active_subscription': active_subscription,
+        'notifications': request.user.notifications.filter(read_at__isnull=True)[:10],
         'prices': PRICES,
     })
 
@@ -271,13 +259,15 @@ def student_subscription(request):
 @login_required
 @student_required
 def student_reviews(request):
-    dishes = Dish.objects.all()
-    user_reviews = {r.dish_id: r for r in Reviews.objects.filter(user=request.user)}
+    query = request.GET.get('q', '').strip()
+    dishes = filter_queryset(Dish.objects.all(), 'dish', query)
+    page = keyset_paginate(request, dishes, ('name', 'id'), per_page=30)
+    user_reviews = {r.dish_id: r for r in Reviews.objects.filter(user=request.user, dish__in=[d.id for d in page])}
     
-    for dish in dishes:
+    for dish in page:
         dish.user_review = user_reviews.get(dish.id)
     
-    return render(request, 'student/reviews.html', {'dishes': dishes})
+    return render(request, 'student/reviews.html', {'dishes': page, 'page': page, 'query': query})
 
 
 @login_required
@@ -292,7 +282,9 @@ def student_add_review(request, dish_id):
             obj = form.save(commit=False)
             obj.user = request.user
             obj.dish = dish
-            obj.save()
+            # Отзыв и агрегаты оценок блюда меняются вместе
+            with transaction.atomic():
+                obj.save()
             messages.success(request, 'Отзыв сохранен')
             return redirect('student_reviews')
     else:
@@ -308,7 +300,7 @@ def student_add_review(request, dish_id):
 @cook_required
 def cook_dashboard(request):
     today = timezone.now().date()
-    menu = Menu.objects.filter(date=today).first()
+    menu = Menu.objects.filter(date=today).prefetch_related('menu_dishes__dish').first()
     low_stock = Product.objects.filter(amount__lt=10)
     my_applications = Applications.objects.filter(user=request.user)[:5]
     
@@ -320,10 +312,22 @@ def cook_dashboard(request):
     })
 
 
+@login_required
+@cook_required
+def cook_consume_inventory(request):
+    if request.method == 'POST':
+        menus, totals = consume_until(timezone.now().date())
+        if menus:
+            messages.success(request, f'Продукты списаны по меню: {menus}, позиций: {len(totals)}')
+        else:
+            messages.info(request, 'Все выданные порции уже списаны')
+    return redirect('cook_dashboard')
+
+
 @login_required
 @cook_required
 def cook_menu(request):
-    menus = Menu.objects.all()[:14]
+    menus = Menu.objects.prefetch_related('menu_dishes__dish')[:14]
     return render(request, 'cook/menu_list.html', {'menus': menus})
 
 
@@ -341,14 +345,35 @@ def cook_menu_edit(request, menu_id=None):
     else:
         form = MenuForm(instance=menu)
     
-    return render(request, 'cook/menu_edit.html', {'form': form, 'menu': menu})
+    dishes = list(form.fields['breakfast_dishes'].queryset)
+    for dish, excluded in zip(dishes, excluded_by_dish([d.alergens_mask for d in dishes])):
+        dish.excluded = int(excluded)
+    return render(request, 'cook/menu_edit.html', {'form': form, 'menu': menu, 'dishes': dishes})
+
+
+@login_required
+@cook_required
+def cook_menu_plan(request):
+    try:
+        plan_date = date.fromisoformat(request.GET.get('date') or (timezone.now().date() + timedelta(days=1)).isoformat())
+    except ValueError:
+        messages.error(request, 'Некорректная дата')
+        return redirect('cook_menu')
+    size = request.GET.get('size', '')
+    size = min(max(int(size), 1), 10) if size.isdigit() else 4
+    
+    plan = plan_menu(plan_date, size)
+    menu = Menu.objects.filter(date=plan_date).first()
+    return render(request, 'cook/menu_plan.html', {'plan': plan, 'menu': menu, 'size': size})
 
 
 @login_required
 @cook_required
 def cook_dishes(request):
-    dishes = Dish.objects.all()
-    return render(request, 'cook/dishes.html', {'dishes': dishes})
+    query = request.GET.get('q', '').strip()
+    dishes = filter_queryset(Dish.objects.all(), 'dish', query)
+    page = keyset_paginate(request, dishes, ('name', 'id'))
+    return render(request, 'cook/dishes.html', {'dishes': page, 'page': page, 'query': query})
 
 
 @login_required
@@ -371,8 +396,10 @@ def cook_dish_edit(request, dish_id=None):
 @login_required
 @cook_required
 def cook_products(request):
-    products = Product.objects.all()
-    return render(request, 'cook/products.html', {'products': products})
+    query = request.GET.get('q', '').strip()
+    products = filter_queryset(Product.objects.prefetch_related('alergens'), 'product', query)
+    page = keyset_paginate(request, products, ('name', 'id'))
+    return render(request, 'cook/products.html', {'products': page, 'page': page, 'query': query})
 
 
 @login_required
@@ -392,10 +419,68 @@ def cook_product_edit(request, product_id=None):
     return render(request, 'cook/product_edit.html', {'form': form, 'product': product})
 
 
+@login_required
+@cook_required
+def cook_serve(request):
+    results = None
+    meal_type = 'lunch'
+    
+    if request.method == 'POST':
+        is_json = request.content_type == 'application/json'
+        if is_json:
+            try:
+                payload = json.loads(request.body)
+            except ValueError:
+                return JsonResponse({'error': 'Некорректный JSON'}, status=400)
+            meal_type = payload.get('meal_type', '')
+            students = payload.get('students', [])
+        else:
+            meal_type = request.POST.get('meal_type', '')
+            students = request.POST.get('students', '').replace(',', ' ').split()
+        
+        try:
+            results = issue_meals(students, meal_type)
+        except CheckoutError as e:
+            if is_json:
+                return JsonResponse({'error': str(e)}, status=409)
+            messages.error(request, str(e))
+        else:
+            issued = sum(1 for r in results if r['status'] in ('paid', 'subscription'))
+            if is_json:
+                return JsonResponse({'issued': issued, 'results': results})
+            messages.success(request, f'Выдано порций: {issued}')
+    
+    return render(request, 'cook/serve.html', {'results': results, 'meal_type': meal_type})
+
+
+@login_required
+@cook_required
+def cook_kiosk(request):
+    return render(request, 'cook/kiosk.html')
+
+
+@login_required
+@cook_required
+def cook_kiosk_snapshot(request):
+    return JsonResponse(build_kiosk_snapshot())
+
+
+@login_required
+@cook_required
+def cook_kiosk_sync(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Только POST'}, status=405)
+    try:
+        pickups = json.loads(request.body).get('pickups', [])
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Некорректный JSON'}, status=400)
+    return JsonResponse({'results': sync_pickups(pickups)})
+
+
 @login_required
 @cook_required
 def cook_applications(request):
-    applications = Applications.objects.filter(user=request.user)
+    applications = Applications.objects.filter(user=request.user).with_products()
     return render(request, 'cook/applications.html', {'applications': applications})
 
 
@@ -403,22 +488,39 @@ def cook_applications(request):
 @cook_required
 def cook_application_create(request):
     if request.method == 'POST':
-        products_ids = request.POST.getlist('products')
-        amounts = request.POST.get('amounts', '')
+        products_ids = [int(x) for x in request.POST.getlist('products') if x.isdigit()]
+        amounts = [int(x.strip()) for x in request.POST.get('amounts', '').split(',') if x.strip().isdigit()]
         price = request.POST.get('price', 0)
+        products = Product.objects.in_bulk(products_ids)
         
-        if products_ids:
-            Applications.objects.create(
-                user=request.user,
-                list_of_products=','.join(products_ids),
-                amount_of_products=amounts,
-                price=int(price) if price else 0
-            )
+        if products:
+            with transaction.atomic():
+                application = Applications.objects.create(
+                    user=request.user,
+                    price=int(price) if price else 0
+                )
+                items = {}
+                for i, product_id in enumerate(products_ids):
+                    if product_id in products and product_id not in items:
+                        items[product_id] = ApplicationItem(
+                            application=application,
+                            product=products[product_id],
+                            amount=amounts[i] if i < len(amounts) else 0
+                        )
+                ApplicationItem.objects.bulk_create(items.values())
             messages.success(request, 'Заявка создана')
             return redirect('cook_applications')
     
-    products = Product.objects.all()
-    return render(request, 'cook/application_create.html', {'products': products})
+    products = list(Product.objects.all())
+    forecast = None
+    if request.GET.get('forecast'):
+        # Черновик по прогнозу: отмечены продукты, которых не хватит на следующую неделю
+        forecast = forecast_week()
+        need = {item['id']: item['need'] for item in forecast['products'] if item['need']}
+        for product in products:
+            product.suggested = need.get(product.id)
+        forecast['amounts'] = ', '.join(str(p.suggested) for p in products if p.suggested)
+    return render(request, 'cook/application_create.html', {'products': products, 'forecast': forecast})
 
 
 @login_required
@@ -427,15 +529,16 @@ def admin_dashboard(request):
     today = timezone.now().date()
     week_ago = today - timedelta(days=7)
     
+    week = summarize_daily_stats(week_ago, today)
+    day = summarize_daily_stats(today, today)
     stats = {
         'total_users': User.objects.filter(role='student').count(),
-        'payments_week': Payment.objects.filter(date__gte=week_ago, succesful=True).aggregate(
-            total=Sum('amount'))['total'] or 0,
-        'attendance_today': Attendance.objects.filter(date=today).count(),
+        'payments_week': week['payments_total'],
+        'attendance_today': day['breakfasts'] + day['lunches'],
         'pending_applications': Applications.objects.filter(status='pending').count(),
     }
     
-    pending = Applications.objects.filter(status='pending')[:5]
+    pending = Applications.objects.filter(status='pending').select_related('user')[:5]
     
     return render(request, 'admin/dashboard.html', {
         'stats': stats,
@@ -447,8 +550,21 @@ def admin_dashboard(request):
 @login_required
 @admin_required
 def admin_applications(request):
-    applications = Applications.objects.all()
-    return render(request, 'admin/applications.html', {'applications': applications})
+    query = request.GET.get('q', '').strip()
+    status = request.GET.get('status', '')
+    applications = Applications.objects.with_products()
+    if status in dict(Applications.STATUS_CHOICES):
+        applications = applications.filter(status=status)
+    if query:
+        applications = applications.filter(user__name__icontains=query)
+    page = keyset_paginate(request, applications, ('-date', '-id'))
+    return render(request, 'admin/applications.html', {
+        'applications': page,
+        'page': page,
+        'query': query,
+        'status': status,
+        'statuses': Applications.STATUS_CHOICES,
+    })
 
 
 @login_required
@@ -457,38 +573,38 @@ def admin_application_action(request, app_id, action):
     application = get_object_or_404(Applications, id=app_id)
     
     if action == 'approve':
-        application.status = 'approved'
-        for product, amount in application.get_products_with_amounts():
-            product.amount += amount
-            product.save()
-        messages.success(request, 'Заявка одобрена, продукты добавлены на склад')
+        if application.approve():
+            record_daily_stats(application.date, purchases_total=application.price)
+            messages.success(request, 'Заявка одобрена, продукты добавлены на склад')
+        else:
+            messages.error(request, 'Заявка уже рассмотрена')
     elif action == 'reject':
-        application.status = 'rejected'
-        messages.info(request, 'Заявка отклонена')
+        if Applications.objects.filter(id=application.id, status='pending').update(status='rejected'):
+            messages.info(request, 'Заявка отклонена')
+        else:
+            messages.error(request, 'Заявка уже рассмотрена')
     
-    application.save()
     return redirect('admin_applications')
 
 
 @login_required
 @admin_required
+@read_only_view
 def admin_statistics(request):
     today = timezone.now().date()
     month_ago = today - timedelta(days=30)
     
-    payments = Payment.objects.filter(date__gte=month_ago, succesful=True)
-    payments_total = payments.aggregate(total=Sum('amount'))['total'] or 0
-    
-    attendance = Attendance.objects.filter(date__gte=month_ago)
-    attendance_by_type = attendance.values('meal_type').annotate(count=Count('id'))
+    month = summarize_daily_stats(month_ago, today)
+    attendance_by_type = [
+        {'meal_type': 'breakfast', 'count': month['breakfasts']},
+        {'meal_type': 'lunch', 'count': month['lunches']},
+    ]
     
-    popular_dishes = Dish.objects.annotate(
-        avg_rating=Sum('reviews__review') / Count('reviews')
-    ).filter(reviews__isnull=False).order_by('-avg_rating')[:5]
+    popular_dishes = Dish.objects.filter(rating_count__gt=0).order_by('-rating_avg', '-rating_count')[:5]
     
     return render(request, 'admin/statistics.html', {
-        'payments_total': payments_total,
-        'payments_count': payments.count(),
+        'payments_total': month['payments_total'],
+        'payments_count': month['payments_count'],
         'attendance_by_type': attendance_by_type,
         'popular_dishes': popular_dishes,
         'month_ago': month_ago,
@@ -498,33 +614,28 @@ def admin_statistics(request):
 
 @login_required
 @admin_required
+@read_only_view
 def admin_reports(request):
     today = timezone.now().date()
     
     start_date = request.GET.get('start_date', (today - timedelta(days=30)).isoformat())
     end_date = request.GET.get('end_date', today.isoformat())
     
-    payments = Payment.objects.filter(
-        date__gte=start_date, date__lte=end_date, succesful=True
-    )
-    attendance = Attendance.objects.filter(
-        date__gte=start_date, date__lte=end_date
-    )
-    applications = Applications.objects.filter(
-        date__gte=start_date, date__lte=end_date, status='approved'
-    )
-    
+    totals = summarize_daily_stats(start_date, end_date)
     report = {
-        'payments_total': payments.aggregate(total=Sum('amount'))['total'] or 0,
-        'payments_count': payments.count(),
-        'attendance_total': attendance.count(),
-        'breakfasts': attendance.filter(meal_type='breakfast').count(),
-        'lunches': attendance.filter(meal_type='lunch').count(),
-        'expenses': applications.aggregate(total=Sum('price'))['total'] or 0,
+        'payments_total': totals['payments_total'],
+        'payments_count': totals['payments_count'],
+        'attendance_total': totals['breakfasts'] + totals['lunches'],
+        'breakfasts': totals['breakfasts'],
+        'lunches': totals['lunches'],
+        'breakfast_revenue': totals['breakfast_revenue'],
+        'lunch_revenue': totals['lunch_revenue'],
+        'expenses': totals['purchases_total'],
     }
     
     return render(request, 'admin/reports.html', {
         'report': report,
+        'exports': EXPORTS,
         'start_date': start_date,
         'end_date': end_date,
     })
@@ -532,9 +643,81 @@ def admin_reports(request):
 
 @login_required
 @admin_required
+@read_only_view
+def admin_reports_export(request, kind):
+    if kind not in EXPORTS:
+        raise Http404
+    today = timezone.now().date()
+    try:
+        start_date = date.fromisoformat(request.GET.get('start_date') or (today - timedelta(days=30)).isoformat())
+        end_date = date.fromisoformat(request.GET.get('end_date') or today.isoformat())
+    except ValueError:
+        messages.error(request, 'Некорректный период')
+        return redirect('admin_reports')
+    
+    stream = astream_export if isinstance(request, ASGIRequest) else stream_export
+    response = StreamingHttpResponse(stream(kind, start_date, end_date), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{kind}_{start_date}_{end_date}.csv"'
+    return response
+
+
+@login_required
+@admin_required
+@read_only_view
 def admin_users(request):
-    users = User.objects.all().order_by('role', 'name')
-    return render(request, 'admin/users.html', {'users': users})
+    query = request.GET.get('q', '').strip()
+    role = request.GET.get('role', '')
+    users = User.objects.all()
+    if role in dict(User.ROLE_CHOICES):
+        users = users.filter(role=role)
+    users = filter_queryset(users, 'user', query)
+    page = keyset_paginate(request, users, ('role', 'name', 'id'))
+    return render(request, 'admin/users.html', {
+        'users': page,
+        'page': page,
+        'query': query,
+        'role': role,
+        'roles': User.ROLE_CHOICES,
+    })
+
+
+@login_required
+@admin_required
+def admin_users_import(request):
+    result = None
+    errors = []
+    
+    if request.method == 'POST':
+        form = RosterImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                rows = validate_roster(read_roster(form.cleaned_data['file'].read()))
+            except UnicodeDecodeError:
+                errors = ['Файл должен быть в кодировке UTF-8']
+            except RosterError as e:
+                errors = e.errors
+            else:
+                result = import_roster(rows, dry_run=form.cleaned_data['dry_run'])
+                if result['dry_run']:
+                    messages.info(request, f"Файл корректен: {result['rows']} учеников")
+                else:
+                    messages.success(request, f"Создано учеников: {result['created']}")
+    else:
+        form = RosterImportForm()
+    
+    return render(request, 'admin/users_import.html', {
+        'form': form,
+        'errors': errors,
+        'result': result,
+    })
+
+
+@login_required
+@admin_required
+def admin_query_stats(request):
+    if request.method == 'POST' and request.POST.get('reset'):
+        query_stats.reset()
+    return JsonResponse({'views': query_stats.snapshot()}, json_dumps_params={'ensure_ascii': False})
 
 
 @login_required